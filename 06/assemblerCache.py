@@ -0,0 +1,129 @@
+"""
+On-disk cache of assembled programs, keyed by a hash of the source
+"""
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+import functools
+
+# Changes to the assembler invalidate every cached output
+ASSEMBLER_SOURCES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py')))
+
+
+@functools.lru_cache(maxsize=None)
+def assemblerHash():
+    """
+    Hash of the assembler sources, computed once per process
+    """
+    digest = hashlib.sha256()
+    for filename in ASSEMBLER_SOURCES:
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class AssemblerCache(object):
+    """
+    Content addressed store of assembler outputs.
+
+    Each entry holds the emitted output file and a metadata file with the
+    word count and symbol map. Entries are evicted least recently used first
+    once the total size of the cache exceeds maxBytes, when evict is called,
+    e.g., once after a batch.
+    """
+    def __init__(self, directory, maxBytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, source, *options):
+        """
+        Hash the assembler sources, output options and source bytes
+        """
+        digest = hashlib.sha256()
+        digest.update(repr((assemblerHash(),) + options).encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.out', base + '.json'
+
+    def get(self, key, outputFile):
+        """
+        Copy a cached output to outputFile
+
+        Returns
+        -------
+        dict or None
+            Entry metadata, or None on a miss
+        """
+        output, meta = self.paths(key)
+        try:
+            with open(meta, 'r') as f:
+                entry = json.load(f)
+            copyAtomic(output, outputFile)
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used, unless another process evicted it meanwhile
+        try:
+            for path in (output, meta):
+                os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, outputFile, entry):
+        """
+        Store an emitted output file with its metadata, e.g., word count and symbol map
+        """
+        output, meta = self.paths(key)
+        copyAtomic(outputFile, output)
+        temp = '{}.{}.tmp'.format(meta, os.getpid())
+        with open(temp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp, meta)
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in maxBytes
+        """
+        entries = {}
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext not in ['.out', '.json']:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.maxBytes:
+                break
+            for path in self.paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+def copyAtomic(source, destination):
+    """
+    Copy a file so that destination is replaced in a single step
+    """
+    temp = '{}.{}.tmp'.format(destination, os.getpid())
+    try:
+        shutil.copyfile(source, temp)
+        os.replace(temp, destination)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
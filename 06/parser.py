@@ -1,5 +1,12 @@
+import os
 import sys
-import argparse
+import functools
+import itertools
+import contextlib
+from array import array
+
+from peephole import PeepholeOptimizer
+from types import MappingProxyType
 
 
 # Constants
@@ -16,9 +23,7 @@ jumpDict['JGE'] = '011'
 jumpDict['JLT'] = '100'
 jumpDict['JNE'] = '101'
 jumpDict['JLE'] = '110'
-
-controlDict_0 = {}
-controlDict_1 = {}
+jumpDict = MappingProxyType(jumpDict)
 
 symbolTable = {}
 symbolTable['SP'] = 0
@@ -44,6 +49,7 @@ symbolTable['R14'] = 14
 symbolTable['R15'] = 15
 symbolTable['SCREEN'] = 16384
 symbolTable['KBD'] = 24576
+symbolTable = MappingProxyType(symbolTable)
 
 
 class SymbolTable():
@@ -51,7 +57,7 @@ class SymbolTable():
     Responsible for symbol table operations.
     """
     def __init__(self):
-        self.table = symbolTable
+        self.table = dict(symbolTable)
         self.index = 16
 
     def addEntry(self, val, idx=None):
@@ -69,45 +75,234 @@ class SymbolTable():
         return self.table[val]
 
 
-## Get control codes from text file
-with open("controls.txt") as f:
-    for line in f:
-        temp = line.strip().split(',')
-        controlDict_0[temp[0]] = temp[1]
-        if len(temp[2]):
-            controlDict_1[temp[2]] = temp[1]
+## Precompiled encoding tables, mapping each instruction field to its bits
+# Comp codes, a-bit followed by c1..c6
+compTable = {}
+compTable['0'] = 0b0101010
+compTable['1'] = 0b0111111
+compTable['-1'] = 0b0111010
+compTable['D'] = 0b0001100
+compTable['A'] = 0b0110000
+compTable['!D'] = 0b0001101
+compTable['!A'] = 0b0110001
+compTable['-D'] = 0b0001111
+compTable['-A'] = 0b0110011
+compTable['D+1'] = 0b0011111
+compTable['A+1'] = 0b0110111
+compTable['D-1'] = 0b0001110
+compTable['A-1'] = 0b0110010
+compTable['D+A'] = 0b0000010
+compTable['D-A'] = 0b0010011
+compTable['A-D'] = 0b0000111
+compTable['D&A'] = 0b0000000
+compTable['D|A'] = 0b0010101
+compTable['M'] = 0b1110000
+compTable['!M'] = 0b1110001
+compTable['-M'] = 0b1110011
+compTable['M+1'] = 0b1110111
+compTable['M-1'] = 0b1110010
+compTable['D+M'] = 0b1000010
+compTable['D-M'] = 0b1010011
+compTable['M-D'] = 0b1000111
+compTable['D&M'] = 0b1000000
+compTable['D|M'] = 0b1010101
+# Commuted forms of the binary operators, e.g., M+D for D+M
+compTable['A+D'] = compTable['D+A']
+compTable['A&D'] = compTable['D&A']
+compTable['A|D'] = compTable['D|A']
+compTable['M+D'] = compTable['D+M']
+compTable['M&D'] = compTable['D&M']
+compTable['M|D'] = compTable['D|M']
+compTable = MappingProxyType(compTable)
+
+destTable = {}
+for dest in range(8):
+    codes = [code for bit, code in zip((4, 2, 1), 'ADM') if dest & bit]
+    for order in itertools.permutations(codes):
+        destTable[''.join(order)] = dest
+destTable = MappingProxyType(destTable)
+
+jumpTable = {jump: int(bits, 2) for jump, bits in jumpDict.items()}
+jumpTable[''] = 0
+jumpTable = MappingProxyType(jumpTable)
+
+
+@functools.lru_cache(maxsize=None)
+def encodeC(command):
+    """
+    Encode a C-instruction, parsing it once into dest, comp and jump fields
+
+    Parameters
+    ----------
+    command: str
+        C-instruction with white space removed, e.g., 'AM=M+1' or 'D;JGT'
+
+    Returns
+    -------
+    int
+        16-bit instruction word
+    """
+    dest, _, rest = command.upper().rpartition('=')
+    comp, _, jump = rest.partition(';')
+    return 0b1110000000000000 | compTable[comp] << 6 | destTable[dest] << 3 | jumpTable[jump]
+
+
+def readCommands(lines):
+    """
+    Lazily clean lines of assembly source
+
+    Yields
+    ------
+    str
+        Next command with comments and white space removed
+    """
+    for line in lines:
+        line = ''.join(line.split('//')[0].split())
+        if len(line):
+            yield line
+
+
+def streamInput(filename):
+    """
+    Lazily read commands from an assembly file
+    """
+    with open(filename, 'r') as f:
+        yield from readCommands(f)
+
+
+def assemble(text):
+    """
+    Assemble Hack assembly source into machine code
+
+    Each call starts from a fresh symbol table, so any number of programs
+    can be assembled in the same process without sharing labels or variables.
+
+    Parameters
+    ----------
+    text: str
+        Assembly source
+
+    Returns
+    -------
+    array
+        array('H') of 16-bit instruction words
+    """
+    return StreamParser().assemble(readCommands(text.splitlines()))
+
+
+def outputPath(filename, binary=False):
+    """
+    Name of the .hack, or packed binary .bin, file produced for an .asm file
+    """
+    return os.path.splitext(filename)[0] + ('.bin' if binary else '.hack')
+
+
+@contextlib.contextmanager
+def atomicOpen(filename, mode='w'):
+    """
+    Open a temporary file beside filename, which replaces filename only once
+    it has been completely written. Readers never see a partial output file.
+    """
+    temp = '{}.{}.tmp'.format(filename, os.getpid())
+    try:
+        with open(temp, mode) as f:
+            yield f
+        os.replace(temp, filename)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def writeBinary(words, filename, byteorder='little'):
+    """
+    Write instruction words as a packed binary ROM image, 2 bytes per word
+
+    Parameters
+    ----------
+    words: array
+        array('H') of 16-bit instruction words
+    filename: str
+        Output file path
+    byteorder: str
+        'little' or 'big'
+    """
+    if byteorder != sys.byteorder:
+        words = array('H', words)
+        words.byteswap()
+    with atomicOpen(filename, 'wb') as f:
+        words.tofile(f)
+
+
+def readBinary(filename, byteorder='little'):
+    """
+    Memory-map a packed binary ROM image
+
+    The file is not copied or parsed when its byte order matches the
+    native one, the words are read directly from the mapped pages.
+
+    Returns
+    -------
+    memoryview or array
+        Sequence of 16-bit instruction words
+    """
+    import mmap
+
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return array('H')
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if byteorder == sys.byteorder:
+        return memoryview(buf).cast('H')
+
+    words = array('H')
+    words.frombytes(buf)
+    words.byteswap()
+    buf.close()
+    return words
 
 
 class Parser(object):
-    def __init__(self, filename):
+    def __init__(self, filename, binary=False, byteorder='little', optimize=False):
         self.filename = filename
-        self.outputFile = self.filename.replace('asm', 'hack')
+        self.binary = binary
+        self.byteorder = byteorder
+        self.outputFile = outputPath(self.filename, binary)
+        self.optimizer = PeepholeOptimizer() if optimize else None
         self.input = self.readInput()
         self.symbolTable = SymbolTable()
         self.indexLabels()
         self.nLines = len(self.input)
         self.currentLine = -1  
         self.currentCommand = None 
+        self.words = array('H')
+        self.assemble()
         self.writeOutput()
 
+    def assemble(self):
+        """
+        Encode each command into the word buffer
+        """
+        while self.advance():
+            commandType = self.commandType
+            if commandType == L_COMMAND:
+                continue
+            elif commandType == A_COMMAND:
+                self.words.append(self.address)
+            elif commandType == C_COMMAND:
+                self.words.append(encodeC(self.currentCommand))
+
     def writeOutput(self):
         """
-        Write output to hack file
+        Write word buffer to hack file, or packed binary file
         """
-        with open(self.outputFile, 'w') as f:
-            while self.advance():
-                if self.commandType == L_COMMAND:
-                    continue
-                elif self.commandType == A_COMMAND:
-                    temp = self.address
-                elif self.commandType == C_COMMAND:
-                    temp = '{types}11{comp}{dest}{jump}'.format(
-                        types=self.commandType,
-                        comp=self.comp,
-                        dest=self.dest,
-                        jump=self.jump)
-                f.write(temp)
-                f.write('\n')
+        if self.binary:
+            writeBinary(self.words, self.outputFile, self.byteorder)
+            return
+
+        with atomicOpen(self.outputFile, 'w') as f:
+            for word in self.words:
+                f.write(f'{word:016b}\n')
 
     def readInput(self):
         """
@@ -116,12 +311,11 @@ class Parser(object):
         Returns
         -------
         List
-            All lines in file
+            All commands in file, after peephole optimization if enabled
         """
-        with open(self.filename, 'r') as f:
-            lines = [line.strip() for line in f.readlines() if len(line.strip()) and not line.startswith('//')]
-            # Remove comments from lines
-            return [line.split('//')[0] for line in lines]
+        if self.optimizer is not None:
+            return list(self.optimizer.optimize(streamInput(self.filename)))
+        return list(streamInput(self.filename))
 
     def indexLabels(self):
         """
@@ -149,7 +343,7 @@ class Parser(object):
         """
         self.currentLine += 1
         if self.hasMoreCommands:
-            self.currentCommand = self.input[self.currentLine].strip().replace(' ', '')
+            self.currentCommand = self.input[self.currentLine]
             return True
         else:
             return False
@@ -168,83 +362,239 @@ class Parser(object):
 
     @property
     def symbol(self):
-        val = symbolTable[self.currentCommand[1:-1]]
-        return f'0{val:015b}'
+        return self.symbolTable.getAddress(self.currentCommand[1:-1])
 
     @property
     def address(self):
         """
-        Take int, or find symbol address in table, 
-        and convert to binary address.
+        Take int, or find symbol address in table.
         """
-        val = self.currentCommand.split('@')[-1]
+        val = self.currentCommand[1:]
 
         # If isdigit, this is a normal address
         if val.isdigit():
-            return f'0{int(val):015b}'
+            return int(val)
 
         # This is a variable, load into symbol table
         if not self.symbolTable.contains(val):
             self.symbolTable.addEntry(val)
-        return f'0{self.symbolTable.getAddress(val):015b}'
+        return self.symbolTable.getAddress(val)
 
-    @property
-    def dest(self):
-        """
-        Construct dest code in binary
+
+class StreamParser(Parser):
+    """
+    Single pass assembler.
+
+    Reads the source once as a stream, encoding each instruction into a
+    compact word buffer. References to symbols that are not yet known are
+    recorded against their buffer position and backpatched once the label
+    is found, or allocated as variables when the stream is exhausted.
+    """
+    def __init__(self, filename=None, binary=False, byteorder='little', optimize=False):
+        self.filename = filename
+        self.binary = binary
+        self.byteorder = byteorder
+        self.optimizer = PeepholeOptimizer() if optimize else None
+        self.symbolTable = SymbolTable()
+        self.words = array('H')
+        self.forwardRefs = {}  # symbol -> buffer positions awaiting its address
+        self.currentCommand = None
+
+        # Without a file, the parser is driven directly through assemble()
+        if filename is not None:
+            self.outputFile = outputPath(self.filename, binary)
+            self.assemble(streamInput(self.filename))
+            self.writeOutput()
+
+    def assemble(self, commands):
         """
-        destStr = ''
-        if '=' in self.currentCommand:
-            destCode = list(self.currentCommand.split('=')[0])
-        else:
-           return '000' 
+        Encode every command in a single pass over the input
 
-        destCode = [code.upper() for code in destCode]
+        Returns
+        -------
+        array
+            array('H') of 16-bit instruction words
+        """
+        if self.optimizer is not None:
+            commands = self.optimizer.optimize(commands)
+
+        for command in commands:
+            self.currentCommand = command
+            commandType = self.commandType
+            if commandType == L_COMMAND:
+                self.addLabel(command[1:-1])
+            elif commandType == A_COMMAND:
+                self.addAddress(command[1:])
+            elif commandType == C_COMMAND:
+                self.words.append(encodeC(command))
+
+        # Anything still unresolved is a variable, allocated in order of first use
+        for val, positions in self.forwardRefs.items():
+            self.symbolTable.addEntry(val)
+            self.backpatch(positions, self.symbolTable.getAddress(val))
+        self.forwardRefs = {}
+        return self.words
 
-        for code in ['A', 'D', 'M']:
-            if code in destCode:
-                destStr += '1'
-            else:
-                destStr += '0'
-        return destStr
+    def addLabel(self, label):
+        """
+        Bind label to the next ROM address and resolve its pending references
+        """
+        if self.symbolTable.contains(label):
+            return
+        self.symbolTable.addEntry(label, len(self.words))
+        if label in self.forwardRefs:
+            self.backpatch(self.forwardRefs.pop(label), len(self.words))
 
-    @property
-    def comp(self):
-        
+    def addAddress(self, val):
         """
-        Construct c-instruction in binary
+        Encode an A-instruction, deferring symbols that are not yet known
         """
-        if '=' in self.currentCommand:
-            compCode = self.currentCommand.split('=')[1]
+        if val.isdigit():
+            self.words.append(int(val))
+        elif self.symbolTable.contains(val):
+            self.words.append(self.symbolTable.getAddress(val))
         else:
-            compCode = self.currentCommand.split(';')[0]
+            self.forwardRefs.setdefault(val, []).append(len(self.words))
+            self.words.append(0)
+
+    def backpatch(self, positions, address):
+        for pos in positions:
+            self.words[pos] = address
 
-        if compCode.upper() in controlDict_0:
-            code = '0'
-            code += controlDict_0[compCode.upper()]
+
+def findSources(paths):
+    """
+    Expand files, directories and glob patterns into a list of .asm files
+    """
+    import glob
+    from pathlib import Path
+
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(sorted(str(f) for f in Path(path).glob('**/*.asm')))
+        elif any(char in path for char in '*?['):
+            sources.extend(sorted(f for f in glob.glob(path, recursive=True) if f.endswith('.asm')))
+        elif not path.endswith('.asm'):
+            raise TypeError("You can only parse assembly files (*.asm)")
         else:
-            code = '1'
-            code += controlDict_1[compCode.upper()]
-        return code
+            sources.append(path)
+    return sources
 
-    @property
-    def jump(self):
-        """
-        Construct jump instruction in binary
-        """
-        if '=' in self.currentCommand:
-            return jumpDict['null']
 
-        jumpCode = self.currentCommand.split(';')[-1].upper()
+def assembleFile(filename, stream=False, binary=False, byteorder='little', optimize=False,
+                 cacheDir=None, cacheSize=256 * 1024 * 1024, evict=True):
+    """
+    Assemble a single file, reusing a cached output when the source is unchanged,
+    and trim the cache to cacheSize afterwards unless evict is False
+
+    Returns
+    -------
+    tuple
+        filename, number of instruction words, time taken in seconds,
+        whether the output came from the cache and the number of
+        instructions saved by the peephole optimizer
+    """
+    import time
+
+    start = time.perf_counter()
+    outputFile = outputPath(filename, binary)
+
+    if cacheDir is not None:
+        from assemblerCache import AssemblerCache
+
+        cache = AssemblerCache(cacheDir, cacheSize)
+        with open(filename, 'rb') as f:
+            key = cache.key(f.read(), binary, byteorder, optimize)
+        entry = cache.get(key, outputFile)
+        if entry is not None:
+            return filename, entry['words'], time.perf_counter() - start, True, entry['saved']
 
-        if jumpCode not in jumpDict:
-            return jumpDict['null']
-        return jumpDict[jumpCode]
+    if stream:
+        asmParser = StreamParser(filename, binary, byteorder, optimize)
+    else:
+        asmParser = Parser(filename, binary, byteorder, optimize)
+    saved = asmParser.optimizer.saved if optimize else 0
+
+    if cacheDir is not None:
+        symbols = {val: idx for val, idx in asmParser.symbolTable.table.items() if val not in symbolTable}
+        cache.put(key, outputFile, {'words': len(asmParser.words), 'saved': saved, 'symbols': symbols})
+        if evict:
+            cache.evict()
+    return filename, len(asmParser.words), time.perf_counter() - start, False, saved
+
+
+def report(filename, words, seconds, cached, saved):
+    """
+    Format the outcome of assembling one file
+    """
+    text = "{}: {} words in {:.3f}s".format(filename, words, seconds)
+    if saved:
+        text += ", {} instructions saved ({:.1f}%)".format(saved, 100 * saved / (words + saved))
+    if cached:
+        text += " (cached)"
+    return text
+
+
+def assembleBatch(filenames, jobs=None, **kwargs):
+    """
+    Assemble many files across a pool of processes, reporting per file
+    timings and overall throughput
+
+    Returns
+    -------
+    int
+        Number of files that failed to assemble
+    """
+    # Imported here so that importing the module as a library stays cheap
+    import time
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    start = time.perf_counter()
+    nWords = 0
+    nSaved = 0
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # The cache is trimmed once at the end rather than after every file
+        futures = {pool.submit(assembleFile, filename, evict=False, **kwargs): filename for filename in filenames}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as err:
+                print("FAILED {}: {!r}".format(futures[future], err))
+                failed += 1
+                continue
+            nWords += result[1]
+            nSaved += result[4]
+            print(report(*result))
+
+    if kwargs.get('cacheDir') is not None:
+        from assemblerCache import AssemblerCache
+
+        AssemblerCache(kwargs['cacheDir'], kwargs.get('cacheSize', 256 * 1024 * 1024)).evict()
+
+    elapsed = time.perf_counter() - start
+    print("Assembled {} files, {} words in {:.3f}s ({:.1f} files/s, {:.0f} words/s)".format(
+        len(filenames) - failed, nWords, elapsed,
+        len(filenames) / elapsed, nWords / elapsed))
+    if nSaved:
+        print("Peephole optimizer saved {} instructions".format(nSaved))
+    return failed
 
 
 if __name__ == "__main__":
+    import argparse
+
     argparser = argparse.ArgumentParser()
-    argparser.add_argument("filename", help="You must add the .asm file as a positional argument")
+    argparser.add_argument("filename", nargs='+', help="The .asm files, directories or glob patterns to assemble")
+    argparser.add_argument("--stream", action="store_true", help="Assemble in a single streaming pass")
+    argparser.add_argument("--binary", action="store_true", help="Write a packed binary (.bin) ROM image")
+    argparser.add_argument("--byteorder", choices=['little', 'big'], default='little', help="Byte order of binary output")
+    argparser.add_argument("--optimize", action="store_true", help="Apply peephole optimizations before encoding")
+    argparser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes for batch assembly")
+    argparser.add_argument("--cache-dir", default=None, help="Reuse outputs of unchanged sources from this directory")
+    argparser.add_argument("--cache-size", type=int, default=256, help="Maximum cache size in MB")
 
     try:
         args = argparser.parse_args()
@@ -252,7 +602,13 @@ if __name__ == "__main__":
         print("Please enter an assembly file to parse.")
         sys.exit()
 
-    if not args.filename.endswith(".asm"):
-        raise TypeError("You can only parse assembly files (*.asm)")
+    sources = findSources(args.filename)
+    options = {'stream': args.stream, 'binary': args.binary, 'byteorder': args.byteorder,
+               'optimize': args.optimize, 'cacheDir': args.cache_dir, 'cacheSize': args.cache_size * 1024 * 1024}
 
-    asmParser = Parser(args.filename)
\ No newline at end of file
+    if len(args.filename) == 1 and os.path.isfile(args.filename[0]):
+        result = assembleFile(sources[0], **options)
+        if args.optimize:
+            print(report(*result))
+    elif assembleBatch(sources, args.jobs, **options):
+        sys.exit(1)
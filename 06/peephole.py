@@ -0,0 +1,159 @@
+"""
+Peephole optimizer for Hack assembly, applied to cleaned commands before encoding
+"""
+
+import itertools
+from collections import Counter, deque
+
+
+def isConstant(command):
+    return command is not None and command.startswith('@') and command[1:].isdigit()
+
+
+# Symbols the assembler predefines to RAM addresses, never to ROM locations
+PREDEFINED = frozenset(['SP', 'LCL', 'ARG', 'THIS', 'THAT', 'SCREEN', 'KBD'] + ['R{}'.format(i) for i in range(16)])
+
+
+def isInstruction(command):
+    return not command.startswith('(')
+
+
+class PeepholeOptimizer(object):
+    """
+    Rewrites short windows of commands into shorter equivalents.
+
+    Windows never span a label, so control can only enter a window at its
+    first command. Registers R13 and R14 are treated as scratch registers, as
+    they are by the VM translator, so values left in them are not preserved.
+    Removing instructions moves code, so jumps must target labels rather than
+    hard coded ROM addresses. A jump whose target was loaded by an
+    A-instruction holding a number other than 0 or a predefined symbol is
+    refused. Targets computed into A, e.g., by A=M, cannot be checked.
+    """
+    def __init__(self):
+        self.rules = [
+            ('stack bounce', 4, self.stackBounce),
+            ('scratch shuffle', 10, self.scratchShuffle),
+            ('fold constant offsets', 5, self.foldOffsets),
+            ('fold constant load', 5, self.foldLoad),
+        ]
+        self.window = max(length for _, length, _ in self.rules)
+        self.hits = Counter()
+        self.before = 0
+        self.after = 0
+        self.target = None  # value of the last A-instruction, while A still holds it
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def optimize(self, commands):
+        """
+        Lazily optimize a stream of commands
+
+        Yields
+        ------
+        str
+            Optimized commands
+        """
+        buffer = deque()
+        for command in commands:
+            self.before += isInstruction(command)
+            buffer.append(command)
+            while len(buffer) >= self.window:
+                if not self.rewrite(buffer):
+                    yield self.emit(buffer.popleft())
+
+        while buffer:
+            if not self.rewrite(buffer):
+                yield self.emit(buffer.popleft())
+
+    def emit(self, command):
+        if command.startswith('('):
+            # Control may arrive from anywhere, with any value in A
+            self.target = None
+        elif command.startswith('@'):
+            self.target = command[1:]
+        else:
+            target = self.target
+            if ';' in command and target is not None and target != '0' \
+                    and (target.isdigit() or target in PREDEFINED):
+                raise ValueError("Cannot optimize a jump to absolute address {}, use a label".format(target))
+            if '=' in command and 'A' in command.split('=')[0]:
+                self.target = None
+        self.after += isInstruction(command)
+        return command
+
+    def rewrite(self, buffer):
+        """
+        Replace the window at the front of buffer, if any rule matches it.
+        Rules return the number of commands consumed and their replacement.
+        """
+        # Every window starts with an A-instruction
+        if not buffer[0].startswith('@'):
+            return False
+
+        for name, length, rule in self.rules:
+            match = rule(list(itertools.islice(buffer, 0, length)))
+            if match is None:
+                continue
+
+            consumed, replacement = match
+            for _ in range(consumed):
+                buffer.popleft()
+            buffer.extendleft(reversed(replacement))
+            self.hits[name] += 1
+            return True
+        return False
+
+    def stackBounce(self, window):
+        """
+        @SP, AM=M+1, @SP, AM=M-1 -> @SP, A=M
+
+        A push immediately undone by a pop leaves SP unchanged and A holding SP.
+        """
+        if window == ['@SP', 'AM=M+1', '@SP', 'AM=M-1']:
+            return 4, ['@SP', 'A=M']
+
+    def scratchShuffle(self, window):
+        """
+        @R13, M=D, @X, D=A, @R14, M=D, @R13, D=M, @R14, A=M -> @X
+
+        Parks D in R13 and the address of X in R14, only to restore D and
+        load the address back into A, as emitted for the static segment.
+        """
+        if len(window) < 10 or window[0] != '@R13' or window[2][0] != '@':
+            return None
+        if window[:2] + window[3:] == ['@R13', 'M=D', 'D=A', '@R14', 'M=D', '@R13', 'D=M', '@R14', 'A=M']:
+            return 10, [window[2]]
+
+    def foldOffsets(self, window):
+        """
+        @a, D=D-A, @b, D=D-A -> @a+b, D=D-A (likewise for D=D+A)
+
+        A is overwritten by the next command, so its final value is not needed.
+        """
+        if len(window) < 5 or not isConstant(window[0]):
+            return None
+        if window[1] in ['D=D-A', 'D=D+A'] and window[3] == window[1] and isConstant(window[2]) \
+                and window[4].startswith('@'):
+            total = int(window[0][1:]) + int(window[2][1:])
+            if total < 0x8000:
+                return 4, ['@{}'.format(total), window[1]]
+
+    def foldLoad(self, window):
+        """
+        @a, D=A, @b, D=D-A -> @a-b, D=A (likewise for D=D+A)
+
+        A is overwritten by the next command, so its final value is not needed.
+        """
+        if len(window) < 5 or not isConstant(window[0]):
+            return None
+        if window[1] == 'D=A' and window[3] in ['D=D-A', 'D=D+A'] and isConstant(window[2]) \
+                and window[4].startswith('@'):
+            if window[3] == 'D=D-A':
+                total = int(window[0][1:]) - int(window[2][1:])
+            else:
+                total = int(window[0][1:]) + int(window[2][1:])
+            if 0 <= total < 0x8000:
+                return 4, ['@{}'.format(total), 'D=A']
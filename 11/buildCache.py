@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+from classIndex import ClassIndex, Subroutine
+
+# Kept in each directory of .vm files
+CACHE_NAME = '.jackCache.json'
+
+# Changes to the compiler invalidate every cached class
+COMPILER_SOURCES = sorted(Path(__file__).resolve().parent.glob('*.py'))
+
+
+def fileHash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def signature(subroutine):
+    """
+    What code calling a subroutine depends on: its kind and arity, None if it does not exist
+    """
+    if subroutine is None:
+        return None
+    return [subroutine.kind, subroutine.nArgs]
+
+
+class RecordingClassIndex(ClassIndex):
+    """
+    View of a ClassIndex recording the signature of every subroutine looked up
+    """
+    def __init__(self, classIndex):
+        super().__init__()
+        self.classes = classIndex.classes
+        self.uses = {}
+
+    def lookup(self, className, name):
+        subroutine = super().lookup(className, name)
+        self.uses['{}.{}'.format(className, name)] = signature(subroutine)
+        return subroutine
+
+
+class BuildCache(object):
+    """
+    Record of the classes compiled, for recompiling only what changed.
+
+    For each .jack file, the cache next to its .vm file keeps the hashes of
+    the source and of the .vm file written, the subroutines it declares and
+    the signatures of the subroutines of other classes its compilation
+    looked up. A file is up to date while its source hash matches, its .vm
+    file is the one written and every subroutine it looked up still has the
+    same signature.
+    """
+    def __init__(self):
+        digest = hashlib.sha256()
+        for fileName in COMPILER_SOURCES:
+            digest.update(fileName.read_bytes())
+        self.compiler = digest.hexdigest()
+        self.directories = {}
+        self.hashes = {}
+
+    def classes(self, directory):
+        """
+        Cache entries of the files of directory, by file name
+        """
+        directory = Path(directory)
+        if directory not in self.directories:
+            try:
+                with open(directory / CACHE_NAME, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('compiler') != self.compiler:
+                data = {'compiler': self.compiler, 'classes': {}}
+            self.directories[directory] = data
+        return self.directories[directory]['classes']
+
+    def sourceHash(self, fileName):
+        if fileName not in self.hashes:
+            self.hashes[fileName] = fileHash(fileName)
+        return self.hashes[fileName]
+
+    def entry(self, fileName):
+        """
+        Cache entry of fileName, None if there is none for its current source
+        """
+        fileName = Path(fileName)
+        entry = self.classes(fileName.parent).get(fileName.name)
+        if entry is None or entry['hash'] != self.sourceHash(fileName):
+            return None
+        return entry
+
+    def subroutines(self, entry):
+        return {name: Subroutine(*fields) for name, fields in entry['subroutines'].items()}
+
+    def isUpToDate(self, fileName, classIndex):
+        entry = self.entry(fileName)
+        if entry is None:
+            return False
+        try:
+            # Catches .vm files written by anything but a cached build
+            if fileHash(Path(fileName).with_suffix('.vm')) != entry.get('vm'):
+                return False
+        except OSError:
+            return False
+        for use, used in entry['uses'].items():
+            className, name = use.split('.')
+            if signature(classIndex.lookup(className, name)) != used:
+                return False
+        return True
+
+    def update(self, fileName, className, subroutines, uses):
+        """
+        Record the compilation of fileName, once its .vm file is written
+        """
+        fileName = Path(fileName)
+        self.classes(fileName.parent)[fileName.name] = {
+            'hash': self.sourceHash(fileName),
+            'vm': fileHash(fileName.with_suffix('.vm')),
+            'class': className,
+            'subroutines': {name: [subroutine.kind, subroutine.nArgs, subroutine.returnType]
+                            for name, subroutine in subroutines.items()},
+            'uses': uses,
+        }
+
+    def save(self):
+        """
+        Write the cache of every directory used, dropping entries of deleted files
+        """
+        for directory, data in self.directories.items():
+            classes = data['classes']
+            for name in [name for name in classes if not (directory / name).exists()]:
+                del classes[name]
+            path = directory / CACHE_NAME
+            temp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temp, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(temp, path)
@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+
+from jackTokenizer import JackTokenizer
+
+SUBROUTINE_KINDS = frozenset(['constructor', 'function', 'method'])
+
+
+class Subroutine(object):
+    __slots__ = ('kind', 'nArgs', 'returnType')
+
+    def __init__(self, kind, nArgs, returnType):
+        self.kind = kind
+        self.nArgs = nArgs  # declared parameters, not counting this of methods
+        self.returnType = returnType
+
+    def __repr__(self):
+        return "Subroutine({}, {}, {})".format(self.kind, self.nArgs, self.returnType)
+
+
+class ClassIndex(object):
+    """
+    Subroutines declared by every class of a project, found by a pre-pass
+    over the tokens of each .jack file so call sites can look them up
+    """
+    def __init__(self):
+        self.classes = {}
+
+    @classmethod
+    def forProject(cls, directory):
+        """
+        Index every .jack file of directory
+        """
+        index = cls()
+        for fileName in sorted(Path(directory).glob('*.jack')):
+            index.addFile(fileName)
+        return index
+
+    def addFile(self, fileName):
+        """
+        Index the class declared in fileName, replacing any earlier entry
+        """
+        tokenizer = JackTokenizer(fileName)
+        values = tokenizer.values
+        count = tokenizer.count
+
+        className = None
+        subroutines = {}
+        depth = 0
+        i = 0
+        while i < count:
+            value = values[i]
+            if value == '{':
+                depth += 1
+            elif value == '}':
+                depth -= 1
+            elif value == 'class' and depth == 0 and i + 1 < count:
+                className = values[i + 1]
+            elif value in SUBROUTINE_KINDS and depth == 1 and i + 3 < count:
+                # kind returnType name ( parameters )
+                returnType, name = values[i + 1], values[i + 2]
+                i += 4
+                nArgs = 0
+                if values[i] != ')':
+                    nArgs = 1
+                while i < count and values[i] != ')':
+                    if values[i] == ',':
+                        nArgs += 1
+                    i += 1
+                subroutines[name] = Subroutine(value, nArgs, returnType)
+                continue
+            i += 1
+
+        if className is not None:
+            self.classes[className] = subroutines
+        return className
+
+    def lookup(self, className, name):
+        """
+        Subroutine name of className, None if either is not indexed
+        """
+        subroutines = self.classes.get(className)
+        if subroutines is None:
+            return None
+        return subroutines.get(name)
+
+    def isMethod(self, className, name):
+        subroutine = self.lookup(className, name)
+        return subroutine is not None and subroutine.kind == 'method'
+
+
+if __name__ == "__main__":
+    index = ClassIndex.forProject(sys.argv[1])
+    for className, subroutines in sorted(index.classes.items()):
+        for name, subroutine in sorted(subroutines.items()):
+            print("{}.{}: {} {} with {} arguments".format(
+                className, name, subroutine.kind, subroutine.returnType, subroutine.nArgs))
@@ -1,9 +1,10 @@
 import sys
 import os
-import re
 from pathlib import Path
 
 from jackTokenizer import *
+from classIndex import ClassIndex
+from symbolTable import UNRESOLVED
 
 OP_CONVERSION = {}
 OP_CONVERSION['+'] = 'add'
@@ -27,13 +28,17 @@ VM_TYPES['argument'] = 'argument'
 VM_TYPES['static'] = 'static'
 VM_TYPES['field'] = 'this'
 
+STATEMENTS = frozenset(['if', 'else', 'let', 'do', 'while', 'return'])
+
 
 class CompilationEngine(object):
-    def __init__(self, fileName, tokenizer, SymbolTable, vmWriter):
+    def __init__(self, fileName, tokenizer, SymbolTable, vmWriter, classIndex=None):
 
         self.tokenizer = tokenizer(fileName)
+        # Subroutines of every class in the project, for telling method calls apart
+        self.classIndex = classIndex or ClassIndex.forProject(Path(fileName).parent)
         self.classTable = SymbolTable()
-        self.subroutineTable = SymbolTable()
+        self.subroutineTable = SymbolTable(self.classTable)
         self.vmWriter = vmWriter(fileName)
         self.className = None
         self.functions = []  # lists functions in class - i.e., not methods or constructors
@@ -45,6 +50,18 @@ class CompilationEngine(object):
     def start(self):
         self.compileClass()
 
+    def compile(self):
+        """
+        Compile the class and close the .vm file, removing it instead if
+        compilation fails so no partial output is left behind
+        """
+        try:
+            self.start()
+        except Exception:
+            self.vmWriter.closeFile(keep=False)
+            raise
+        self.vmWriter.closeFile()
+
     @property 
     def newLabel(self):
         self.labelIndex += 1
@@ -54,6 +71,32 @@ class CompilationEngine(object):
     def currentLabel(self):
         return "{}".format(self.labelIndex)
 
+    def resolveVariable(self, name):
+        symbol = self.subroutineTable.resolve(name)
+        if symbol is UNRESOLVED:
+            # Called with the variable as the current token
+            token = self.tokenizer.token
+            raise ValueError("{}: {} is not defined on line {}, column {}".format(
+                self.className, name, token.line, token.column))
+        return symbol
+
+    def compileCallee(self, obj):
+        """
+        Push obj if it is a variable, for calling a method of the object it holds
+
+        Returns
+        -------
+        tuple
+            Name of the class of the subroutine called, and whether obj is a
+            class name rather than a variable
+        """
+        symbol = self.subroutineTable.resolve(obj)
+        if symbol is UNRESOLVED:
+            # Its a builtin, so use token
+            return obj, True
+        self.vmWriter.writePush(VM_TYPES[symbol.kind], symbol.index)  # convert kind to a VM_TYPE e.g., method vars become local
+        return symbol.type, False
+
     def compileClass(self):
         if not self.tokenizer.keyWord == 'class':
             return
@@ -154,7 +197,7 @@ class CompilationEngine(object):
         if not isConstructor:
             self.vmWriter.writeFunction(functionName, nLocals)
         else:
-            nLocals = self.classTable.symbolTable['kind'].count('field')
+            nLocals = self.classTable.varCount('field')
             self.vmWriter.writeFunction(functionName, nLocals)
 
         # write statements
@@ -225,12 +268,12 @@ class CompilationEngine(object):
         return nLocals
 
     def compileStatements(self):
-        writeStatements = self.tokenizer.currentToken in ['if', 'else', 'let', 'do', 'while', 'return']
+        writeStatements = self.tokenizer.currentToken in STATEMENTS
         if not writeStatements:
             return
 
         while writeStatements:
-            writeStatements = self.tokenizer.currentToken in ['if', 'else', 'let', 'do', 'while', 'return']
+            writeStatements = self.tokenizer.currentToken in STATEMENTS
             if not writeStatements:
                 break
             if self.tokenizer.currentToken in ['if', 'else']:
@@ -274,30 +317,9 @@ class CompilationEngine(object):
                 # method class name
                 obj = self.tokenizer.identifier
 
-                try:
-                    # If obj is a type of object in the subroutine table, its a local object or parameter
-                    if self.subroutineTable.typeOf(obj):
-                        objType = self.subroutineTable.typeOf(obj)
-                        objKind = VM_TYPES[self.subroutineTable.kindOf(obj)]  # convert kind to a VM_TYPE e.g., method vars become local
-                        try:
-                            objIndex = self.subroutineTable.indexOf('this')
-                        except:
-                            objIndex = self.subroutineTable.indexOf(obj)
-                        methodCall += objType
-                        self.vmWriter.writePush(objKind, objIndex)
-                except:  
-                    # If obj is a type of object in the subroutine table, its a local object or parameter
-                    try:
-                        if self.classTable.typeOf(obj):
-                            objType = self.classTable.typeOf(obj)
-                            objKind = VM_TYPES[self.classTable.kindOf(obj)]  # convert kind to a VM_TYPE e.g., method vars become local
-                            objIndex = self.classTable.indexOf(obj)
-                            methodCall += objType
-                            self.vmWriter.writePush(objKind, objIndex)
-                    except: 
-                        # Its a builtin, so use token
-                        methodCall += obj
-                        useBuiltin = True
+                # A variable holds the object to call a method of, otherwise obj names a class
+                className, useBuiltin = self.compileCallee(obj)
+                methodCall += className
 
                 self.tokenizer.advance()
 
@@ -315,10 +337,8 @@ class CompilationEngine(object):
                 self.tokenizer.advance()
 
             # Write constructor call
-            # Check variable is a method
-            regex = re.compile( r'method (\w+) {}'.format(funName) )
-            match = re.search(regex, self.tokenizer.codeStream)
-            if match or not useBuiltin: 
+            # Method calls pass the object as an extra argument
+            if not useBuiltin or self.classIndex.isMethod(obj, funName):
                 nExpressions += 1
 
             if len(methodCall) > 0:
@@ -352,12 +372,9 @@ class CompilationEngine(object):
             isArray = True
 
         # Get the kind and index, as a local or class variable
-        try:
-            kind=VM_TYPES[self.subroutineTable.kindOf(name)]  # convert kind to a VM_TYPE e.g., method vars become local
-            index=self.subroutineTable.indexOf(name)
-        except:
-            kind=VM_TYPES[self.classTable.kindOf(name)]
-            index=self.classTable.indexOf(name)
+        symbol = self.resolveVariable(name)
+        kind = VM_TYPES[symbol.kind]  # convert kind to a VM_TYPE e.g., method vars become local
+        index = symbol.index
 
         self.tokenizer.advance()
 
@@ -579,8 +596,9 @@ class CompilationEngine(object):
                 # Varname [ expression ]
                 # array name
                 arr = self.tokenizer.identifier
-                arrIndex = self.subroutineTable.indexOf(arr)
-                arrKind = self.subroutineTable.kindOf(arr)
+                symbol = self.resolveVariable(arr)
+                arrIndex = symbol.index
+                arrKind = symbol.kind
                 self.tokenizer.advance()
 
                 # open square brackets
@@ -610,30 +628,9 @@ class CompilationEngine(object):
                 # subroutine call 2 - method call
                 obj = self.tokenizer.identifier
 
-                try:
-                    # If obj is a type of object in the subroutine table, its a local object or parameter
-                    if self.subroutineTable.typeOf(obj):
-                        objType = self.subroutineTable.typeOf(obj)
-                        objKind = VM_TYPES[self.subroutineTable.kindOf(obj)]  # convert kind to a VM_TYPE e.g., method vars become local
-                        try:
-                            objIndex = self.subroutineTable.indexOf('this')
-                        except:
-                            objIndex = self.subroutineTable.indexOf(obj)
-                        methodCall += objType
-                        self.vmWriter.writePush(objKind, objIndex)
-                except:  
-                    # If obj is a type of object in the subroutine table, its a local object or parameter
-                    try:
-                        if self.classTable.typeOf(obj):
-                            objType = self.classTable.typeOf(obj)
-                            objKind = VM_TYPES[self.classTable.kindOf(obj)]  # convert kind to a VM_TYPE e.g., method vars become local
-                            objIndex = self.classTable.indexOf(obj)
-                            methodCall += objType
-                            self.vmWriter.writePush(objKind, objIndex)
-                    except: 
-                        # Its a builtin, so use token
-                        methodCall += obj
-                        useBuiltin = True
+                # A variable holds the object to call a method of, otherwise obj names a class
+                className, useBuiltin = self.compileCallee(obj)
+                methodCall += className
 
                 self.tokenizer.advance()
                 # dot separator
@@ -654,13 +651,9 @@ class CompilationEngine(object):
                 # variable name
                 name = self.tokenizer.identifier
 
-                try:
-                    kind=self.subroutineTable.kindOf(name)
-                    index=self.subroutineTable.indexOf(name)
-                except:
-                    kind=self.classTable.kindOf(name)
-                    index=self.classTable.indexOf(name)
-
+                symbol = self.resolveVariable(name)
+                kind = symbol.kind
+                index = symbol.index
 
                 self.vmWriter.writePush(VM_TYPES[kind], index)
                 self.tokenizer.advance()
@@ -668,12 +661,8 @@ class CompilationEngine(object):
         # Write method call
         if len(methodCall) > 0:
             
-            # Check variable is not a function type
-            regex = re.compile( r'method (\w+) {}'.format(funName) )
-            match = re.search(regex, self.tokenizer.codeStream)
-
-            # Check if call is to a constructor - this not pushed on constructors
-            if match or not useBuiltin: 
+            # Check if call is to a constructor or function - this not pushed on them
+            if not useBuiltin or self.classIndex.isMethod(obj, funName):
                 nExpressions += 1
 
             self.vmWriter.writeCall(methodCall, nExpressions + isMethod) 
@@ -727,9 +716,23 @@ class CompilationEngine(object):
 
 
 if __name__ == "__main__":
-    arg = sys.argv[1]
-    eng = CompilationEngine(arg)
-    eng.closeFile()
- 
- 
- 
\ No newline at end of file
+    import time
+    import contextlib
+    from symbolTable import SymbolTable
+    from vmWriter import VMWriter
+
+    # Compile each file, or each file of a directory, repeatedly and report the best time
+    for arg in sys.argv[1:]:
+        path = Path(arg)
+        fileNames = sorted(path.glob('*.jack')) if path.is_dir() else [path]
+        classIndex = ClassIndex.forProject(path if path.is_dir() else path.parent)
+        for fileName in fileNames:
+            best = None
+            for _ in range(20):
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    start = time.perf_counter()
+                    eng = CompilationEngine(fileName, JackTokenizer, SymbolTable, VMWriter, classIndex)
+                    eng.compile()
+                    elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print("{}: {:.2f}ms".format(fileName, 1000 * best))
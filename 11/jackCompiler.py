@@ -1,31 +1,125 @@
-import sys
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from compilationEngine import CompilationEngine
 from jackTokenizer import JackTokenizer
 from symbolTable import SymbolTable
 from vmWriter import VMWriter
+from classIndex import ClassIndex
+from buildCache import BuildCache, RecordingClassIndex
 from pathlib import Path
 
+
+def indexFile(fileName):
+    """
+    Subroutines declared in fileName, as (class name, subroutines by name)
+    """
+    classIndex = ClassIndex()
+    className = classIndex.addFile(fileName)
+    return className, classIndex.classes.get(className, {})
+
+
+def compileFile(fileName, classIndex):
+    """
+    Compile fileName to a .vm file next to it, looking calls up in classIndex
+
+    Returns
+    -------
+    tuple
+        Path of the .vm file, name of the class and the signatures of the
+        subroutines of other classes looked up, by Class.name
+    """
+    classIndex = RecordingClassIndex(classIndex)
+    compiler = CompilationEngine(fileName, JackTokenizer, SymbolTable, VMWriter, classIndex)
+    compiler.compile()
+    return compiler.vmWriter.outputFilePath, compiler.className, classIndex.uses
+
+
 class JackCompiler(object):
-    def __init__(self):
-        pass
+    """
+    Compiles the .jack files of a project in two passes over a process pool:
+    the first indexes the subroutines of every class, the second generates
+    the VM code of each class against the merged index. With a single job,
+    by default on a single CPU, both passes run in this process.
 
+    With a BuildCache, files whose source is unchanged are not indexed
+    again, and only files whose source or whose dependencies' signatures
+    changed are compiled. With force, every file is compiled and the cache
+    is still updated.
+    """
+    def __init__(self, jobs=None, buildCache=None, force=False):
+        self.jobs = jobs
+        self.buildCache = buildCache
+        self.force = force
 
-if __name__ == "__main__":
-    args = sys.argv[1]
-
-    files = Path(args)    
-    if files.is_dir():
-        filePath = list(Path(files.name).glob('**/*.jack'))
-        for eachFile in filePath:
-            compiler = CompilationEngine(eachFile, JackTokenizer, SymbolTable, VMWriter)
-            compiler.start()
-            compiler.vmWriter.closeFile()
-    else:
-        compiler = CompilationEngine(files, JackTokenizer, SymbolTable, VMWriter)
-        compiler.start()
-        compiler.vmWriter.closeFile()
+    def compileProject(self, fileNames):
+        """
+        Returns
+        -------
+        list
+            Paths of the .vm files written, in the order of fileNames,
+            leaving out those that were up to date
+        """
+        fileNames = [Path(fileName) for fileName in fileNames]
+        jobs = self.jobs or os.cpu_count() or 1
+        if jobs == 1 or len(fileNames) < 2:
+            return self.build(fileNames, map)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return self.build(fileNames, pool.map)
+
+    def build(self, fileNames, mapper):
+        cache = self.buildCache
+        classIndex = ClassIndex()
+        toIndex = []
+        for fileName in fileNames:
+            entry = cache.entry(fileName) if cache else None
+            if entry is None:
+                toIndex.append(fileName)
+            else:
+                classIndex.classes[entry['class']] = cache.subroutines(entry)
+        for className, subroutines in mapper(indexFile, toIndex):
+            if className is not None:
+                classIndex.classes[className] = subroutines
 
+        stale = [fileName for fileName in fileNames
+                 if self.force or not (cache and cache.isUpToDate(fileName, classIndex))]
+        results = list(mapper(compileFile, stale, [classIndex] * len(stale)))
+        if cache:
+            for fileName, (_, className, uses) in zip(stale, results):
+                cache.update(fileName, className, classIndex.classes.get(className, {}), uses)
+            cache.save()
+        return [vmFile for vmFile, _, _ in results]
 
 
+def projectFiles(paths):
+    """
+    The .jack files given, and those found under the directories given
+    """
+    fileNames = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            fileNames.extend(sorted(path.glob('**/*.jack')))
+        else:
+            fileNames.append(path)
+    return fileNames
 
 
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('paths', nargs='+', help="The .jack files or directories of the project, e.g., an application and the OS")
+    argParser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes, 1 to compile in this process")
+    argParser.add_argument('--force', action='store_true', help="Compile every file, even if it is up to date")
+    args = argParser.parse_args()
+
+    paths = [Path(path) for path in args.paths]
+    cache = BuildCache()
+    if len(paths) == 1 and not paths[0].is_dir():
+        # A single file is compiled against the classes of its directory
+        classIndex = ClassIndex.forProject(paths[0].parent)
+        _, className, uses = compileFile(paths[0], classIndex)
+        cache.update(paths[0], className, classIndex.classes.get(className, {}), uses)
+        cache.save()
+    else:
+        fileNames = projectFiles(paths)
+        compiled = JackCompiler(args.jobs, cache, args.force).compileProject(fileNames)
+        print("{} compiled, {} up to date".format(len(compiled), len(fileNames) - len(compiled)))
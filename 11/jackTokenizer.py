@@ -1,12 +1,15 @@
+import re
 import sys
-import copy
+from bisect import bisect_right
+from array import array
+from itertools import accumulate, chain
 
 SYMBOLS = ['{', '}', '(', ')', '[', ']', '.', ',', ';', '+', '-', '*', '/', '&', '|', '<', '>', '=', '~'] 
 KEYWORDS = ['class', 'constructor', 'function', 'method', 'field', 
     'static', 'var', 'int', 'char', 'boolean', 'void', 'true', 
     'false', 'null', 'this', 'let', 'do', 'if', 'else', 'while', 'return']
-OPERATORS = ['+', '-', '*', '/', '&', '|', '<', '>', '=', '~'] 
-UN_OP = ['~', '-']
+OPERATORS = frozenset(['+', '-', '*', '/', '&', '|', '<', '>', '=', '~'])
+UN_OP = frozenset(['~', '-'])
 
 CONVERT_SYMBOL = {}
 CONVERT_SYMBOL['<'] = '&lt;'
@@ -20,132 +23,197 @@ INT_CONST = 3
 STRING_CONST = 4
 
 
+# One match per token: the white space and comments before it, then the token.
+# A /* left as a token is a comment that is never closed
+TOKENS = re.compile(r'''
+    ((?:\s+|//[^\n]*|/\*.*?\*/)*)
+    ("[^"\n]*"|\d+|[A-Za-z_]\w*|/\*|\S)
+''', re.VERBOSE | re.DOTALL)
+
+KEYWORD_SET = frozenset(KEYWORDS)
+SYMBOL_SET = frozenset(SYMBOLS)
+
+
+def classify(value):
+    """
+    Type code of a token value, None if it is no Jack token
+    """
+    if value in KEYWORD_SET:
+        return KEYWORD
+    elif value in SYMBOL_SET:
+        return SYMBOL
+    elif value[0] == '"':
+        # A quote without its closing quote on the same line scans alone
+        return STRING_CONST if len(value) > 1 and value[-1] == '"' else None
+    elif value[0].isdigit():
+        return INT_CONST
+    elif value[0].isalpha() or value[0] == '_':
+        return IDENTIFIER
+    return None
+
+
+def lineStarts(code):
+    """
+    Offsets in code at which each line starts
+    """
+    return array('l', [0] + [match.end() for match in re.finditer('\n', code)])
+
+
+def tokenize(code):
+    """
+    Scan Jack source into parallel arrays
+
+    Returns
+    -------
+    tuple
+        Type codes, start and end offsets in code and interned values of
+        every token, in order
+    """
+    pairs = TOKENS.findall(code)
+    values = [sys.intern(value) for _, value in pairs]
+
+    # Offsets follow from the lengths of the skipped text and of the tokens
+    bounds = array('l', accumulate(map(len, chain.from_iterable(pairs))))
+
+    # Classify each distinct value once
+    kinds = {}
+    for value in set(values):
+        kinds[value] = classify(value)
+        if kinds[value] is None:
+            start = bounds[2 * values.index(value)]
+            starts = lineStarts(code)
+            line = bisect_right(starts, start)
+            if value == '"':
+                problem = "Unterminated string"
+            elif value == '/*':
+                problem = "Unterminated comment"
+            else:
+                problem = "Unexpected character {!r}".format(value)
+            raise ValueError("{} on line {}, column {}".format(problem, line, start - starts[line - 1] + 1))
+    types = array('b', map(kinds.__getitem__, values))
+    return types, bounds[0::2], bounds[1::2], values
+
+
+class Token(object):
+    """
+    A scanned token with its type code and position, lines and columns
+    counting from 1
+    """
+    __slots__ = ('type', 'value', 'start', 'end', 'line', 'column')
+
+    def __init__(self, type, value, start, end, line, column):
+        self.type = type
+        self.value = value
+        self.start = start
+        self.end = end
+        self.line = line
+        self.column = column
+
+    def __repr__(self):
+        return "Token({!r}, line {}, column {})".format(self.value, self.line, self.column)
+
+
 class JackTokenizer (object):
+    """
+    Token stream of a Jack file.
+
+    The file is scanned once into parallel arrays, so advance, lookAhead
+    and tokenType only index them. The arrays end with an empty identifier,
+    the current token before the first advance and once the tokens are
+    exhausted. Token objects, with line and column, are only built for the
+    tokens asked for.
+    """
     def __init__(self, fileName):
         self.currentToken = None
         self.codeStream = self.openFile(fileName)
-        self.index = 0
+        self.types, self.starts, self.ends, self.values = tokenize(self.codeStream)
+        self.count = len(self.values)
+        self.types.append(IDENTIFIER)
+        self.values.append('')
+        self.index = -1
+        self.tokens = [None] * len(self.values)
+        self.lines = None
 
     def openFile(self, fileName):
         """
         Open Jack file and return stream of chars as str
         """
         with open(fileName, 'r') as f:
-            code = f.readlines()
-
-        # Remove inline comments of //
-        # Difficult to deal with as they have no end point
-        code = [line.split("//")[0] for line in code]
-        code = ''.join(code)
-
-        # Remove all white space, tabs, and newlines
-        return code
+            return f.read()
 
     @property
     def hasMoreTokens(self):
-        return self.index < (len(self.codeStream)-1) 
+        return self.index + 1 < self.count
 
     def lookAhead(self):
         """
-        Look ahead n spaces
+        Value of the token following the current one
         """
-        nextToken = self.codeStream[self.index]
-        currentIndex = copy.copy(self.index)
-        
-        while nextToken in [' ', '', '/t', '/n']:
-            currentIndex += 1
-            nextToken = self.codeStream[currentIndex]
-        return nextToken
-
+        return self.values[min(self.index + 1, self.count)]
 
     def advance(self):
-        # Only inline and API comments need to be handled
-        # These can be handled by checking for the closing comment symbols
-        temp = ''
-        runCode = True
-        inString = False
-
-        while runCode and self.hasMoreTokens:
-            if self.codeStream[self.index] in [' ', '\t', '\n'] and len(temp) == 0:
-                self.index += 1
-                continue
-            # Check for comments
-            elif self.codeStream[self.index:self.index+2] == '/*':
-                self.index += 2
-                inComment = True
-                while (inComment):
-                    if inComment and self.codeStream[self.index-2:self.index] == '*/':
-                        inComment = False
-                    self.index += 1  # increment past final comment symbol
-            else:
-                # Check for symbol only
-                char = self.codeStream[self.index]
-
-                if char == '"' and inString:
-                    inString = False
-                elif char == '"' and not inString:
-                    inString = True
-
-                if inString:
-                    temp += char
-                    self.index += 1
-                    continue
-                elif char in SYMBOLS and len(temp) == 0:
-                    temp = char
-                    self.index += 1
-                    runCode = False
-                    break
-                # Check for trailing symbol or space, after keywords, identifiers etc
-                elif char in SYMBOLS or char in [' ', '\t', '\n'] and len(temp) > 0 and not inString:
-                    runCode = False
-                    break
-                temp = temp + char
-                self.index += 1
-        
-        self.currentToken = temp
+        if self.index < self.count:
+            self.index += 1
+        self.currentToken = self.values[self.index]
 
     @property
     def tokenType(self):
-        if self.currentToken in SYMBOLS:
-            return SYMBOL
-        elif self.currentToken in KEYWORDS:
-            return KEYWORD
-        elif self.currentToken.startswith('"'):
-            return STRING_CONST
-        elif self.currentToken.isdigit():
-            return INT_CONST
-        else:
-            return IDENTIFIER
+        return self.types[self.index]
+
+    @property
+    def token(self):
+        """
+        The current Token
+        """
+        return self.tokenAt(self.index)
+
+    def tokenAt(self, index):
+        token = self.tokens[index]
+        if token is None:
+            if self.lines is None:
+                self.lines = lineStarts(self.codeStream)
+            if index < self.count:
+                start, end = self.starts[index], self.ends[index]
+            else:
+                start = end = len(self.codeStream)
+            line = bisect_right(self.lines, start)
+            token = Token(self.types[index], self.values[index], start, end, line, start - self.lines[line - 1] + 1)
+            self.tokens[index] = token
+        return token
 
     @property
     def keyWord(self):
-        if self.tokenType == KEYWORD:
+        if self.types[self.index] == KEYWORD:
             return self.currentToken
 
     @property
     def symbol(self):
-        if self.tokenType == SYMBOL:
-            if self.currentToken in CONVERT_SYMBOL:
-                return CONVERT_SYMBOL[self.currentToken]
-            return self.currentToken
-    
+        if self.types[self.index] == SYMBOL:
+            return CONVERT_SYMBOL.get(self.currentToken, self.currentToken)
+
     @property
     def identifier(self):
-        if self.tokenType == IDENTIFIER:
+        if self.types[self.index] == IDENTIFIER:
             return self.currentToken
 
     @property
     def intVal(self):
-        if self.tokenType == INT_CONST:
+        if self.types[self.index] == INT_CONST:
             return self.currentToken
 
     @property
     def stringVal(self):
-        if self.tokenType == STRING_CONST:
-            return self.currentToken.replace(';', '\;').replace('"', '')
+        if self.types[self.index] == STRING_CONST:
+            return self.currentToken.replace(';', '\\;').replace('"', '')
 
 if __name__ == "__main__":
-    arg = sys.argv[1]
-    tokenizer = JackTokenizer(arg)
-    while(tokenizer.hasMoreTokens):
-        tokenizer.advance()
\ No newline at end of file
+    import time
+
+    # Tokenize each file given and report the time taken
+    for arg in sys.argv[1:]:
+        start = time.perf_counter()
+        tokenizer = JackTokenizer(arg)
+        while(tokenizer.hasMoreTokens):
+            tokenizer.advance()
+        elapsed = time.perf_counter() - start
+        print("{}: {} tokens in {:.2f}ms".format(arg, tokenizer.count, 1000 * elapsed))
@@ -1,58 +1,94 @@
-from collections import defaultdict
 STATIC = 'static'
 FIELD = 'field'
 
 
+class Symbol(object):
+    __slots__ = ('name', 'type', 'kind', 'index')
+
+    def __init__(self, name, types, kind, index):
+        self.name = name
+        self.type = types
+        self.kind = kind
+        self.index = index
+
+    def __repr__(self):
+        return "Symbol({}, {}, {}, {})".format(self.name, self.type, self.kind, self.index)
+
+
+# Resolution result for names no scope defines
+UNRESOLVED = Symbol(None, None, None, None)
+
+
 class SymbolTable(object):
-    def __init__(self):
-        self.symbolTable = {}
-        self.defaultKeys = ['name', 'type', 'kind', 'index']
+    """
+    Symbols of one scope by name, with a running count per kind.
+
+    A table may have a parent scope, e.g., the class scope of a subroutine
+    scope, that resolve falls back to for names it does not define.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
         self.startSubroutine()
 
     def startSubroutine(self, table=None):
-        self.symbolTable = {}
-        for key in self.defaultKeys:
-            self.symbolTable.setdefault(key, [])
+        self.symbols = {}
+        self.counts = {}
 
     def define(self, name, types, kind):
 
-        if name in self.symbolTable['name']:
+        if name in self.symbols:
             return
 
-        varCount = self.varCount(kind)
-        self.symbolTable['name'].append(name)
-        self.symbolTable['type'].append(types)
-        self.symbolTable['kind'].append(kind)
-        self.symbolTable['index'].append(varCount)
+        varCount = self.counts.get(kind, 0)
+        self.symbols[name] = Symbol(name, types, kind, varCount)
+        self.counts[kind] = varCount + 1
 
     def varCount(self, kind):
-        return self.symbolTable['kind'].count(kind)
+        return self.counts.get(kind, 0)
+
+    def lookup(self, name):
+        """
+        Symbol name of this scope, None if it is not defined here
+        """
+        return self.symbols.get(name)
+
+    def resolve(self, name):
+        """
+        Symbol name of the innermost scope defining it, UNRESOLVED for any
+        other name such as a class name
+        """
+        table = self
+        while table is not None:
+            symbol = table.symbols.get(name)
+            if symbol is not None:
+                return symbol
+            table = table.parent
+        return UNRESOLVED
+
+    def entry(self, name):
+        symbol = self.symbols.get(name)
+        if symbol is None:
+            raise ValueError("{} is not defined".format(name))
+        return symbol
 
     def kindOf(self, name):
-        idx = self.symbolTable['name'].index(name)
-        return self.symbolTable['kind'][idx]
+        return self.entry(name).kind
 
     def typeOf(self, name):
-        idx = self.symbolTable['name'].index(name)
-        return self.symbolTable['type'][idx]
+        return self.entry(name).type
 
     def indexOf(self, name):
-        idx = self.symbolTable['name'].index(name)
-        return self.symbolTable['index'][idx]
+        return self.entry(name).index
 
 
 if __name__ == "__main__":
     b = SymbolTable()
     for i in range(3):
         b.define('x', 'static', STATIC)
-    
+
     b.define('y', 'int', FIELD)
     b.define('z', 'char', FIELD)
     print(b.kindOf('x'))
     print(b.typeOf('y'))
     print(b.indexOf('z'))
-    print(b.symbolTable)
-
-
-
-    
\ No newline at end of file
+    print(b.symbols)
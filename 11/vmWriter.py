@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 class VMWriter(object):
@@ -12,10 +13,16 @@ class VMWriter(object):
         self.outputFilePath = str(f.parent / f.stem) + '.vm'
 
     def openFile(self, fileName):
-        self.outputFile = open(fileName, 'w+')
+        # Written under a temporary name, replacing fileName only once complete
+        self.tempFilePath = '{}.{}.tmp'.format(fileName, os.getpid())
+        self.outputFile = open(self.tempFilePath, 'w+')
 
-    def closeFile(self):
+    def closeFile(self, keep=True):
         self.outputFile.close()
+        if keep:
+            os.replace(self.tempFilePath, self.outputFilePath)
+        else:
+            os.remove(self.tempFilePath)
 
     def writePush(self, first, second=0):
         self.outputFile.write("push {} {}\n".format(first, second))
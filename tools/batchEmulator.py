@@ -0,0 +1,134 @@
+"""
+Vectorized emulation of many Hack computers running the same program in lockstep
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from hackEmulator import ROM_SIZE, RAM_SIZE, loadProgram, signed
+
+
+class BatchMachine(object):
+    """
+    N Hack computers sharing one ROM, each with its own A, D, PC and RAM.
+
+    Registers are kept as vectors and RAM as an N x 32K matrix, so every
+    step fetches, decodes and executes the current instruction of all
+    machines with a fixed number of array operations. Machines may diverge,
+    each follows its own PC. The ALU is evaluated from the zx, nx, zy, ny,
+    f and no control bits, exactly as the hardware does.
+    """
+    def __init__(self, program, n):
+        self.n = n
+        self.rom = np.zeros(ROM_SIZE, dtype=np.int64)
+        self.rom[:len(program)] = np.asarray(program, dtype=np.int64)
+        self.ram = np.zeros((n, RAM_SIZE), dtype=np.uint16)
+        self.rows = np.arange(n)
+        self.A = np.zeros(n, dtype=np.int64)
+        self.D = np.zeros(n, dtype=np.int64)
+        self.PC = np.zeros(n, dtype=np.int64)
+        self.cycles = 0
+
+        # Flag both instructions of '(END) @END 0;JMP' loops, where machines
+        # are done, as a machine in the loop alternates between them
+        self.haltAt = np.zeros(ROM_SIZE, dtype=bool)
+        for pc in range(1, len(program)):
+            if program[pc - 1] == pc - 1 and program[pc] == 0b1110101010000111:
+                self.haltAt[pc - 1:pc + 1] = True
+
+    def reset(self):
+        self.PC[:] = 0
+
+    @property
+    def halted(self):
+        """
+        Boolean vector of machines sitting in an end loop
+        """
+        return self.haltAt[self.PC]
+
+    def step(self):
+        """
+        Execute one instruction on every machine
+        """
+        w = self.rom[self.PC]
+        a, d = self.A, self.D
+        address = a & 0x7FFF
+
+        isC = (w & 0x8000) != 0
+        bit = lambda n: (w >> n) & 1 == 1
+
+        # ALU, x is D and y is A or M depending on the a-bit
+        m = self.ram[self.rows, address].astype(np.int64)
+        x = np.where(bit(11), 0, d)
+        x = np.where(bit(10), ~x & 0xFFFF, x)
+        y = np.where(bit(12), m, a)
+        y = np.where(bit(9), 0, y)
+        y = np.where(bit(8), ~y & 0xFFFF, y)
+        out = np.where(bit(7), (x + y) & 0xFFFF, x & y)
+        out = np.where(bit(6), ~out & 0xFFFF, out)
+
+        # Jump, using the A register before it is written
+        jlt = bit(2) & (out >= 0x8000)
+        jeq = bit(1) & (out == 0)
+        jgt = bit(0) & (out > 0) & (out < 0x8000)
+        jump = isC & (jlt | jeq | jgt)
+        self.PC = np.where(jump, address, (self.PC + 1) & 0x7FFF)
+
+        # Destinations
+        writeM = isC & bit(3)
+        self.ram[self.rows[writeM], address[writeM]] = out[writeM]
+        self.D = np.where(isC & bit(4), out, d)
+        self.A = np.where(isC, np.where(bit(5), out, a), w)
+        self.cycles += 1
+
+    def run(self, cycles, stopOnHalt=True, checkEvery=64):
+        """
+        Execute up to cycles instructions on every machine
+
+        Parameters
+        ----------
+        cycles: int
+            Maximum number of instructions to execute
+        stopOnHalt: bool
+            Stop early once every machine is in an end loop, checked every
+            checkEvery instructions
+
+        Returns
+        -------
+        int
+            Number of instructions executed
+        """
+        for n in range(cycles):
+            if stopOnHalt and n % checkEvery == 0 and self.halted.all():
+                return n
+            self.step()
+        return cycles
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('filename', help="The .hack, .bin or .asm program to run")
+    argParser.add_argument('-n', type=int, default=1000, help="Number of machines")
+    argParser.add_argument('--cycles', type=int, default=10000, help="Maximum number of instructions per machine")
+    argParser.add_argument('--random', nargs='*', type=int, default=[], metavar='ADDR', help="RAM addresses to fill with random values")
+    argParser.add_argument('--max', type=int, default=100, help="Upper bound of random values")
+    argParser.add_argument('--seed', type=int, default=None, help="Random seed")
+    argParser.add_argument('--dump', nargs='*', type=int, default=[], metavar='ADDR', help="RAM addresses to print when done")
+    args = argParser.parse_args()
+
+    machine = BatchMachine(loadProgram(args.filename), args.n)
+    rng = np.random.default_rng(args.seed)
+    for address in args.random:
+        machine.ram[:, address] = rng.integers(0, args.max, args.n)
+
+    start = time.perf_counter()
+    n = machine.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    print("{} machines x {} instructions in {:.3f}s ({:.2f} M instructions/s), {} halted".format(
+        args.n, n, elapsed, args.n * n / elapsed / 1e6, machine.halted.sum()))
+    addresses = sorted(set(args.random + args.dump))
+    for row in range(min(args.n, 10)):
+        print(' '.join('RAM[{}]={}'.format(address, signed(int(machine.ram[row, address]))) for address in addresses))
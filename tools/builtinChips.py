@@ -0,0 +1,193 @@
+"""
+Behavioural models of the memory chips and I/O devices, used by the HDL simulator in place of gates
+"""
+
+from array import array
+
+from hackEmulator import loadProgram
+
+
+class BuiltinChip(object):
+    """
+    Array backed stand-in for a chip.
+
+    Subclasses declare their pins in HDL and list in combinational the input
+    pins their outputs follow within a clock cycle, e.g., the address of a
+    RAM, so the simulator can order them among the gates. pins maps each pin
+    name to its wires. As in the nand2tetris builtin chips, tick commits the
+    new state, visible through indexing, and outputs follow it once tock has
+    re-evaluated the chip.
+    """
+    hdl = None
+    outputs = ('out',)
+    combinational = ()
+
+    def __init__(self, name, pins):
+        self.name = name
+        self.pins = pins
+
+    def read(self, values, pin):
+        return sum((values[wire] & 1) << i for i, wire in enumerate(self.pins[pin]))
+
+    def write(self, values, pin, value):
+        for i, wire in enumerate(self.pins[pin]):
+            values[wire] = (value >> i) & 1
+
+    def eval(self, values):
+        pass
+
+    def tick(self, values):
+        pass
+
+    def tock(self):
+        pass
+
+
+class Register(BuiltinChip):
+    hdl = 'CHIP Register { IN in[16], load; OUT out[16]; BUILTIN Register; CLOCKED in, load; }'
+
+    def __init__(self, name, pins):
+        super().__init__(name, pins)
+        self.value = 0
+        self.out = 0
+
+    def __getitem__(self, index):
+        return self.value
+
+    def __setitem__(self, index, value):
+        self.value = self.out = value & 0xFFFF
+
+    def eval(self, values):
+        self.write(values, 'out', self.out)
+
+    def tick(self, values):
+        if self.read(values, 'load'):
+            self.value = self.read(values, 'in')
+
+    def tock(self):
+        self.out = self.value
+
+
+class PC(Register):
+    hdl = 'CHIP PC { IN in[16], load, inc, reset; OUT out[16]; BUILTIN PC; CLOCKED in, load, inc, reset; }'
+
+    def tick(self, values):
+        if self.read(values, 'reset'):
+            self.value = 0
+        elif self.read(values, 'load'):
+            self.value = self.read(values, 'in')
+        elif self.read(values, 'inc'):
+            self.value = (self.value + 1) & 0xFFFF
+
+
+class RAM(BuiltinChip):
+    """
+    Memory of size 16-bit words, whose output follows the address immediately
+    """
+    size = 0
+    combinational = ('address',)
+
+    def __init__(self, name, pins):
+        super().__init__(name, pins)
+        self.memory = array('H', bytes(2 * self.size))
+
+    def __getitem__(self, index):
+        return self.memory[index]
+
+    def __setitem__(self, index, value):
+        self.memory[index] = value & 0xFFFF
+
+    def eval(self, values):
+        self.write(values, 'out', self.memory[self.read(values, 'address')])
+
+    def tick(self, values):
+        if self.read(values, 'load'):
+            self.memory[self.read(values, 'address')] = self.read(values, 'in')
+
+
+def ramHDL(name, addressBits):
+    return 'CHIP {0} {{ IN in[16], load, address[{1}]; OUT out[16]; BUILTIN {0}; CLOCKED in, load; }}'.format(
+        name, addressBits)
+
+
+class RAM8(RAM):
+    size = 8
+    hdl = ramHDL('RAM8', 3)
+
+
+class RAM64(RAM):
+    size = 64
+    hdl = ramHDL('RAM64', 6)
+
+
+class RAM512(RAM):
+    size = 512
+    hdl = ramHDL('RAM512', 9)
+
+
+class RAM4K(RAM):
+    size = 4096
+    hdl = ramHDL('RAM4K', 12)
+
+
+class RAM16K(RAM):
+    size = 16384
+    hdl = ramHDL('RAM16K', 14)
+
+
+class Screen(RAM):
+    size = 8192
+    hdl = ramHDL('Screen', 13)
+
+
+class Keyboard(BuiltinChip):
+    hdl = 'CHIP Keyboard { OUT out[16]; BUILTIN Keyboard; }'
+
+    def __init__(self, name, pins):
+        super().__init__(name, pins)
+        self.key = 0
+
+    def __getitem__(self, index):
+        return self.key
+
+    def __setitem__(self, index, value):
+        self.key = value & 0xFFFF
+
+    def eval(self, values):
+        self.write(values, 'out', self.key)
+
+
+class ROM32K(RAM):
+    size = 32768
+    hdl = 'CHIP ROM32K { IN address[15]; OUT out[16]; BUILTIN ROM32K; }'
+
+    def load(self, filename):
+        """
+        Load a .hack, .bin or .asm program, clearing the rest of the ROM
+        """
+        program = loadProgram(filename)
+        self.memory = array('H', bytes(2 * self.size))
+        self.memory[:len(program)] = array('H', program)
+
+    def tick(self, values):
+        pass
+
+
+# Models by chip name, used for these chips unless gates are forced
+BUILTIN_CHIPS = {
+    'Register': Register,
+    'ARegister': Register,
+    'DRegister': Register,
+    'PC': PC,
+    'RAM8': RAM8,
+    'RAM64': RAM64,
+    'RAM512': RAM512,
+    'RAM4K': RAM4K,
+    'RAM16K': RAM16K,
+    'Screen': Screen,
+    'Keyboard': Keyboard,
+    'ROM32K': ROM32K,
+}
+
+# Pin declarations of the models, for chips with no .hdl file
+BUILTIN_HDL = {name: model.hdl for name, model in BUILTIN_CHIPS.items() if name not in ['ARegister', 'DRegister']}
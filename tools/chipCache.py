@@ -0,0 +1,88 @@
+"""
+On-disk cache of flattened and levelized chips, keyed by a hash of the .hdl files they are built from
+"""
+
+import os
+import json
+import hashlib
+import functools
+from pathlib import Path
+
+from hdlParser import ROOT
+
+CACHE_DIR = ROOT / '.chipCache'
+
+# Changes to the parser, the flattening and compilation rules, the netlist
+# format or the pins of the models invalidate every entry
+TOOL_SOURCES = [ROOT / 'tools' / name for name in ['hdlParser.py', 'hdlSimulator.py', 'builtinChips.py', 'chipCache.py']]
+
+
+@functools.lru_cache(maxsize=None)
+def toolHash():
+    """
+    Hash of the tool sources, computed once per process
+    """
+    digest = hashlib.sha256()
+    for filename in TOOL_SOURCES:
+        digest.update(filename.read_bytes())
+    return digest.hexdigest()
+
+
+class ChipCache(object):
+    """
+    Store of serialized netlists.
+
+    A chip's key hashes the tool sources and the contents of every .hdl
+    file in its dependency closure, so editing any sub-chip invalidates
+    every chip built from it. Only the latest entry of each chip file and
+    option set is kept.
+    """
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = Path(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, library, name, *options):
+        """
+        Hash the tool sources, options and the .hdl files chip name depends on
+        """
+        digest = hashlib.sha256()
+        digest.update(repr((toolHash(), name) + options).encode())
+        for filename in library.dependencies(name):
+            digest.update(str(filename).encode())
+            digest.update(filename.read_bytes())
+        return digest.hexdigest()
+
+    def path(self, filename, key, *options):
+        # Chips of the same name in different directories, e.g., Xor, are kept apart
+        filename = Path(filename).resolve()
+        directory = hashlib.sha256(str(filename.parent).encode()).hexdigest()[:12]
+        prefix = '-'.join([filename.stem, directory] + [str(option) for option in options])
+        return self.directory / '{}-{}.json'.format(prefix, key)
+
+    def get(self, filename, key, *options):
+        """
+        Returns
+        -------
+        dict or None
+            The serialized netlist, or None on a miss
+        """
+        try:
+            with open(self.path(filename, key, *options), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, filename, key, data, *options):
+        """
+        Store a serialized netlist, replacing older entries of the same chip file and options
+        """
+        path = self.path(filename, key, *options)
+        prefix = path.name[:-len(key) - len('.json')]
+        for stale in self.directory.glob(prefix + '*.json'):
+            if stale != path and len(stale.name) == len(path.name):
+                stale.unlink(missing_ok=True)
+
+        temp = path.with_name('{}.{}.tmp'.format(path.name, os.getpid()))
+        with open(temp, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp, path)
@@ -0,0 +1,166 @@
+"""
+Event-driven simulation engine for flattened chips
+"""
+
+from hdlSimulator import Simulator
+
+
+class EventSimulator(Simulator):
+    """
+    Simulator re-evaluating only the gates whose inputs changed.
+
+    Writing a different value to a wire queues the gates and parts reading
+    it. Queued gates are evaluated level by level, in the order computed by
+    levelize, so each is evaluated at most once per eval and only after all
+    of its inputs have settled. A gate whose output keeps its value queues
+    nothing further. Behavioural parts are re-evaluated on every eval, as
+    their state can change without any wire changing.
+    """
+    def __init__(self, netlist, lanes=1, levels=None, code=None):
+        super().__init__(netlist, lanes, levels, code)
+        nodes = netlist.nands + netlist.parts
+        index = {id(node): i for i, node in enumerate(nodes)}
+        self.nodes = nodes
+        self.nNands = len(netlist.nands)
+        self.level = [0] * len(nodes)
+        for depth, level in enumerate(self.levels):
+            for node in level:
+                self.level[index[id(node)]] = depth
+
+        self.fanout = [[] for _ in range(netlist.wires)]
+        for i, (a, b, _) in enumerate(netlist.nands):
+            self.fanout[a].append(i)
+            if b != a:
+                self.fanout[b].append(i)
+        for i, part in enumerate(netlist.parts, self.nNands):
+            for pin in part.combinational:
+                for wire in part.pins[pin]:
+                    self.fanout[wire].append(i)
+
+        self.buckets = [[] for _ in self.levels]
+        self.queued = bytearray(len(nodes))
+        self.settled = False
+        self.evaluations = 0
+
+    def changed(self, wire):
+        """
+        Queue the readers of wire, after its value changed
+        """
+        queued = self.queued
+        for node in self.fanout[wire]:
+            if not queued[node]:
+                queued[node] = 1
+                self.buckets[self.level[node]].append(node)
+
+    def write(self, wire, value):
+        if self.values[wire] != value:
+            self.values[wire] = value
+            self.changed(wire)
+
+    def __setitem__(self, name, value):
+        for i, wire in enumerate(self.netlist.pin(name)):
+            self.write(wire, self.mask if (value >> i) & 1 else 0)
+
+    def setLanes(self, name, values):
+        old = [self.values[wire] for wire in self.netlist.pin(name)]
+        super().setLanes(name, values)
+        for wire, value in zip(self.netlist.pin(name), old):
+            if self.values[wire] != value:
+                self.changed(wire)
+
+    def eval(self):
+        values = self.values
+        if not self.settled:
+            # Nothing is known about the initial wire values, so evaluate everything once
+            self.evaluate(values, self.mask)
+            self.settled = True
+            self.evaluations += len(self.nodes)
+            for bucket in self.buckets:
+                for node in bucket:
+                    self.queued[node] = 0
+                bucket.clear()
+            return
+
+        for i in range(self.nNands, len(self.nodes)):
+            if not self.queued[i]:
+                self.queued[i] = 1
+                self.buckets[self.level[i]].append(i)
+
+        mask = self.mask
+        nands = self.netlist.nands
+        nNands = self.nNands
+        queued = self.queued
+        fanout = self.fanout
+        level = self.level
+        buckets = self.buckets
+        for bucket in buckets:
+            if not bucket:
+                continue
+            self.evaluations += len(bucket)
+            for node in bucket:
+                queued[node] = 0
+                if node < nNands:
+                    a, b, out = nands[node]
+                    value = mask ^ (values[a] & values[b])
+                    if values[out] == value:
+                        continue
+                    values[out] = value
+                    for reader in fanout[out]:
+                        if not queued[reader]:
+                            queued[reader] = 1
+                            buckets[level[reader]].append(reader)
+                else:
+                    part = self.nodes[node]
+                    wires = [wire for pin in part.outputs for wire in part.pins[pin]]
+                    old = [values[wire] for wire in wires]
+                    part.eval(values)
+                    for wire, value in zip(wires, old):
+                        if values[wire] != value:
+                            self.changed(wire)
+            bucket.clear()
+
+    def tock(self):
+        for (_, q), bits in zip(self.netlist.dffs, self.state):
+            self.write(q, bits)
+        for part in self.netlist.parts:
+            part.tock()
+        self.eval()
+        self.time += 1
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    from pathlib import Path
+
+    from hdlParser import ROOT
+    from chipCache import CACHE_DIR
+    from testRunner import ENGINES, runTest
+
+    argParser = argparse.ArgumentParser(description="Compare the simulation engines on test scripts")
+    argParser.add_argument('filename', nargs='*', help="The .tst scripts to run, by default those of projects 03 and 05")
+    argParser.add_argument('--repeat', type=int, default=3, help="Runs per script and engine, the fastest is reported")
+    argParser.add_argument('--force-gate', action='store_true', help="Simulate memory chips at gate level, never substituting their models")
+    args = argParser.parse_args()
+
+    scripts = args.filename or sorted(str(path) for project in ['03', '05'] for path in (ROOT / project).rglob('*.tst'))
+    totals = dict.fromkeys(ENGINES, 0.0)
+    print("{:40} {:>10} {:>10} {:>8}".format('script', 'levelized', 'event', 'speedup'))
+    for script in scripts:
+        times = {}
+        for engine in ENGINES:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                status, message, _ = runTest(script, args.force_gate, CACHE_DIR, engine)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            times[engine] = best
+            totals[engine] += best
+        if status == 'SKIP':
+            continue
+        print("{:40} {:>9.3f}s {:>9.3f}s {:>7.2f}x{}".format(
+            str(Path(script).resolve().relative_to(ROOT)), times['levelized'], times['event'],
+            times['levelized'] / times['event'], '' if status == 'PASS' else ' ' + status))
+    print("{:40} {:>9.3f}s {:>9.3f}s {:>7.2f}x".format(
+        'total', totals['levelized'], totals['event'], totals['levelized'] / totals['event']))
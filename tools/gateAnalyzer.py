@@ -0,0 +1,237 @@
+"""
+Reports the Nand count and critical path of chips written in the nand2tetris HDL
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+from hdlParser import ROOT, SEARCH_PATH, ChipLibrary, HDLError
+from builtinChips import BUILTIN_CHIPS, BUILTIN_HDL
+from hdlSimulator import flattenChip, levelize
+from chipCache import CACHE_DIR, ChipCache
+
+# Bump when the content of an analysis changes
+ANALYSIS_VERSION = '1'
+
+
+def countGates(library, name, counts=None):
+    """
+    Count the primitives a chip expands to, as flattenChip expands it with
+    forceGate set
+
+    Parameters
+    ----------
+    library: ChipLibrary
+        Definitions of the parts
+    name: str
+        Name of the chip
+    counts: dict
+        Counts of the chips already visited, by name
+
+    Returns
+    -------
+    dict
+        Number of Nand gates, DFFs and builtin parts of every name
+    """
+    if counts is None:
+        counts = {}
+    if name in counts:
+        return counts[name]
+
+    chip = library.get(name)
+    if chip.builtin in ['Nand', 'DFF']:
+        total = {chip.builtin: 1}
+    elif chip.builtin is not None and name in BUILTIN_CHIPS:
+        total = {name: 1}
+    elif not chip.parts:
+        raise HDLError("Chip {} has no gate-level implementation".format(chip.name))
+    else:
+        total = {}
+        for partName, _ in chip.parts:
+            for primitive, count in countGates(library, partName, counts).items():
+                total[primitive] = total.get(primitive, 0) + count
+    counts[name] = total
+    return total
+
+
+def wireNames(netlist):
+    """
+    Map wires to the top-level pin or signal bit they carry
+    """
+    names = {}
+    for pins in (netlist.internals, netlist.outputs, netlist.inputs):
+        for pin, bus in pins.items():
+            for i, wire in enumerate(bus):
+                names[wire] = pin if len(bus) == 1 else '{}[{}]'.format(pin, i)
+    return names
+
+
+def criticalPath(netlist, levels):
+    """
+    Longest chain of Nand gates between inputs, DFF outputs or part outputs
+    and the gates reading nothing deeper
+
+    Behavioural parts on the path count as no gates.
+
+    Returns
+    -------
+    tuple
+        Depth in Nand gates and the list of wires along the path, from its
+        source to the output of its last gate
+    """
+    driver = {}
+    depth = {}
+    previous = {}
+    deepest = None
+    for level in levels:
+        for node in level:
+            if isinstance(node, tuple):
+                reads, outputs, cost = node[:2], [node[2]], 1
+            else:
+                reads = [wire for pin in node.combinational for wire in node.pins[pin]]
+                outputs, cost = [wire for pin in node.outputs for wire in node.pins[pin]], 0
+            source = max(reads, key=lambda wire: depth.get(driver.get(wire), 0), default=None)
+            depth[id(node)] = depth.get(driver.get(source), 0) + cost
+            previous[id(node)] = source
+            for wire in outputs:
+                driver[wire] = id(node)
+            if deepest is None or depth[id(node)] > depth[id(deepest)]:
+                deepest = node
+
+    if deepest is None:
+        return 0, []
+    nodes = {id(node): node for level in levels for node in level}
+    wire = deepest[2] if isinstance(deepest, tuple) else deepest.pins[deepest.outputs[0]][0]
+    path = [wire]
+    while wire in driver:
+        wire = previous[driver[wire]]
+        if wire is None:
+            break
+        path.append(wire)
+    return depth[id(deepest)], path[::-1]
+
+
+def analyze(filename):
+    """
+    Flatten the chip defined in filename to gates and measure it
+
+    Returns
+    -------
+    dict
+        JSON compatible analysis: totals, a breakdown by part of the chip,
+        the depth of the longest combinational path and the top-level
+        signals it runs through
+    """
+    library = ChipLibrary.forFile(filename, BUILTIN_HDL)
+    name = Path(filename).stem
+    chip = library.get(name)
+    netlist = flattenChip(library, name, forceGate=True)
+    depth, path = criticalPath(netlist, levelize(netlist))
+
+    counts = {}
+    breakdown = {}
+    for partName, _ in chip.parts:
+        entry = breakdown.setdefault(partName, {'instances': 0, 'nands': 0, 'dffs': 0})
+        gates = countGates(library, partName, counts)
+        entry['instances'] += 1
+        entry['nands'] += gates.get('Nand', 0)
+        entry['dffs'] += gates.get('DFF', 0)
+
+    names = wireNames(netlist)
+    signals = []
+    for wire in path:
+        if wire in names and names[wire] not in signals:
+            signals.append(names[wire])
+    return {
+        'chip': netlist.name,
+        'nands': len(netlist.nands),
+        'dffs': len(netlist.dffs),
+        'builtins': sorted(part.name for part in netlist.parts),
+        'depth': depth,
+        'path': signals,
+        'breakdown': breakdown,
+    }
+
+
+def cachedAnalyze(filename, cacheDir=None):
+    """
+    Analysis of the chip defined in filename, reused from cacheDir until the
+    simulator or any .hdl file it is built from changes
+    """
+    if cacheDir is None:
+        return analyze(filename)
+    library = ChipLibrary.forFile(filename, BUILTIN_HDL)
+    name = Path(filename).stem
+    cache = ChipCache(cacheDir)
+    key = cache.key(library, name, 'analysis', ANALYSIS_VERSION)
+    data = cache.get(filename, key, 'analysis')
+    if data is None:
+        data = analyze(filename)
+        cache.put(filename, key, data, 'analysis')
+    return data
+
+
+def report(data):
+    print("{}: {} Nand gates, {} DFFs, critical path of {} Nand gates".format(
+        data['chip'], data['nands'], data['dffs'], data['depth']))
+    if data['builtins']:
+        print("  builtin parts: {}".format(', '.join(data['builtins'])))
+    if data['path']:
+        print("  path: {}".format(' -> '.join(data['path'])))
+    for partName, entry in sorted(data['breakdown'].items(), key=lambda item: -item[1]['nands']):
+        share = 100.0 * entry['nands'] / data['nands'] if data['nands'] else 0.0
+        print("  {:16} x{:<4} {:8} Nand {:6} DFF {:6.1f}%".format(
+            partName, entry['instances'], entry['nands'], entry['dffs'], share))
+
+
+def regressions(data, baseline):
+    """
+    Measures of data that grew over baseline
+    """
+    for measure in ['nands', 'dffs', 'depth']:
+        if measure in baseline and data[measure] > baseline[measure]:
+            yield "{} {} grew from {} to {}".format(data['chip'], measure, baseline[measure], data[measure])
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('filename', nargs='*', help="The .hdl files to analyze, by default those of every project")
+    argParser.add_argument('--baseline', default=None, metavar='FILE', help="Fail if any chip has more gates or depth than in FILE")
+    argParser.add_argument('--update', action='store_true', help="Write the measures to the baseline file instead")
+    argParser.add_argument('--json', action='store_true', help="Print the analyses as JSON")
+    argParser.add_argument('--chip-cache', default=str(CACHE_DIR), metavar='DIR', help="Directory of cached analyses, empty to disable")
+    args = argParser.parse_args()
+
+    filenames = [Path(filename).resolve() for filename in args.filename]
+    if not filenames:
+        filenames = sorted(path for directory in SEARCH_PATH for path in directory.glob('*.hdl'))
+
+    results = {}
+    for filename in filenames:
+        try:
+            data = cachedAnalyze(filename, args.chip_cache or None)
+        except HDLError as err:
+            print("{}: {}".format(filename.name, err), file=sys.stderr)
+            continue
+        try:
+            key = str(filename.relative_to(ROOT))
+        except ValueError:
+            key = str(filename)
+        results[key] = data
+        if not args.json:
+            report(data)
+    if args.json:
+        print(json.dumps(results, indent=1, sort_keys=True))
+
+    if args.baseline and args.update:
+        baseline = {key: {measure: data[measure] for measure in ['nands', 'dffs', 'depth']}
+                    for key, data in results.items()}
+        Path(args.baseline).write_text(json.dumps(baseline, indent=1, sort_keys=True) + '\n')
+    elif args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        failures = [failure for key, data in results.items() for failure in regressions(data, baseline.get(key, {}))]
+        for failure in failures:
+            print("REGRESSION " + failure)
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,346 @@
+"""
+Headless Hack computer emulator, for running .hack programs without the CPUEmulator
+"""
+
+import sys
+import time
+import argparse
+from array import array
+from pathlib import Path
+
+# The assembler lives with project 06
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / '06'))
+from parser import assemble, readBinary
+
+
+ROM_SIZE = 32768
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# Jump bits, j1 j2 j3, set when the ALU output is < 0, = 0 or > 0
+JLT = 4
+JEQ = 2
+JGT = 1
+HALT = 8  # Marks the '@n, 0;JMP' idiom used to end a program
+
+
+def signed(val):
+    """
+    Interpret a 16-bit word as a two's complement integer
+    """
+    return val - 0x10000 if val & 0x8000 else val
+
+
+# ALU expressions, keyed by the a-bit and c1..c6 bits of a C-instruction.
+# {m} stands for the M register, the RAM word addressed by A.
+COMP_EXPR = {}
+COMP_EXPR[0b0101010] = '0'
+COMP_EXPR[0b0111111] = '1'
+COMP_EXPR[0b0111010] = '0xFFFF'
+COMP_EXPR[0b0001100] = 'd'
+COMP_EXPR[0b0110000] = 'a'
+COMP_EXPR[0b0001101] = '~d & 0xFFFF'
+COMP_EXPR[0b0110001] = '~a & 0xFFFF'
+COMP_EXPR[0b0001111] = '-d & 0xFFFF'
+COMP_EXPR[0b0110011] = '-a & 0xFFFF'
+COMP_EXPR[0b0011111] = '(d + 1) & 0xFFFF'
+COMP_EXPR[0b0110111] = '(a + 1) & 0xFFFF'
+COMP_EXPR[0b0001110] = '(d - 1) & 0xFFFF'
+COMP_EXPR[0b0110010] = '(a - 1) & 0xFFFF'
+COMP_EXPR[0b0000010] = '(d + a) & 0xFFFF'
+COMP_EXPR[0b0010011] = '(d - a) & 0xFFFF'
+COMP_EXPR[0b0000111] = '(a - d) & 0xFFFF'
+COMP_EXPR[0b0000000] = 'd & a'
+COMP_EXPR[0b0010101] = 'd | a'
+COMP_EXPR[0b1110000] = '{m}'
+COMP_EXPR[0b1110001] = '~{m} & 0xFFFF'
+COMP_EXPR[0b1110011] = '-{m} & 0xFFFF'
+COMP_EXPR[0b1110111] = '({m} + 1) & 0xFFFF'
+COMP_EXPR[0b1110010] = '({m} - 1) & 0xFFFF'
+COMP_EXPR[0b1000010] = '(d + {m}) & 0xFFFF'
+COMP_EXPR[0b1010011] = '(d - {m}) & 0xFFFF'
+COMP_EXPR[0b1000111] = '({m} - d) & 0xFFFF'
+COMP_EXPR[0b1000000] = 'd & {m}'
+COMP_EXPR[0b1010101] = 'd | {m}'
+
+# Interpreter ALU functions built from the expressions
+COMP = {comp: eval('lambda a, d, m: ' + expr.format(m='m')) for comp, expr in COMP_EXPR.items()}
+
+# Python conditions for each jump field, in terms of the ALU output y
+JUMP_EXPR = {}
+JUMP_EXPR[JGT] = '0 < y < 0x8000'
+JUMP_EXPR[JEQ] = 'y == 0'
+JUMP_EXPR[JEQ | JGT] = 'y < 0x8000'
+JUMP_EXPR[JLT] = 'y >= 0x8000'
+JUMP_EXPR[JLT | JGT] = 'y != 0'
+JUMP_EXPR[JLT | JEQ] = 'y == 0 or y >= 0x8000'
+JUMP_EXPR[JLT | JEQ | JGT] = 'True'
+
+
+def loadHack(filename):
+    """
+    Read a textual .hack file into an array of words
+    """
+    with open(filename, 'r') as f:
+        return array('H', (int(line, 2) for line in f if len(line.strip())))
+
+
+def loadProgram(filename, byteorder='little'):
+    """
+    Load machine code from a .hack, packed binary .bin or .asm file
+
+    Returns
+    -------
+    array or memoryview
+        16-bit instruction words
+    """
+    if filename.endswith('.bin'):
+        return readBinary(filename, byteorder)
+    elif filename.endswith('.asm'):
+        with open(filename, 'r') as f:
+            return assemble(f.read())
+    return loadHack(filename)
+
+
+class HackMachine(object):
+    """
+    The Hack computer: CPU, ROM and RAM, including the memory maps.
+
+    Each ROM word is decoded once, when loaded, into a dispatch tuple of
+    (comp function, reads M, dest bits, jump bits, value), where comp is None
+    for A-instructions and value is the constant they load.
+    """
+    def __init__(self, program=None):
+        self.rom = array('H', bytes(2 * ROM_SIZE))
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        self.decoded = []
+        self.A = 0
+        self.D = 0
+        self.PC = 0
+        self.cycles = 0
+        self.halted = False
+        self.load(program or [])
+
+    def load(self, program):
+        """
+        Load instruction words into ROM and decode them
+        """
+        if len(program) > ROM_SIZE:
+            raise ValueError("Program of {} words does not fit in ROM".format(len(program)))
+        self.rom = array('H', bytes(2 * ROM_SIZE))
+        self.rom[:len(program)] = array('H', program)
+        self.decoded = [self.decode(word) for word in self.rom]
+
+        # Flag the jumps of '(END) @END 0;JMP' loops so execution can stop there
+        for pc in range(1, len(program)):
+            if self.decoded[pc - 1] == (None, False, 0, 0, pc - 1) and self.rom[pc] == 0b1110101010000111:
+                self.decoded[pc] = self.decoded[pc][:3] + (HALT | JLT | JEQ | JGT,) + self.decoded[pc][4:]
+        self.reset()
+
+    def decode(self, word):
+        if not word & 0x8000:
+            return (None, False, 0, 0, word)
+        comp = (word >> 6) & 0x7F
+        if comp not in COMP:
+            raise ValueError("Invalid instruction {:016b}".format(word))
+        return (COMP[comp], bool(word & 0x1000), (word >> 3) & 0b111, word & 0b111, 0)
+
+    def reset(self):
+        """
+        Restart execution from ROM address 0, as the reset button does
+        """
+        self.PC = 0
+        self.halted = False
+
+    def setKey(self, code):
+        self.ram[KBD] = code
+
+    def run(self, cycles, stopOnHalt=True):
+        """
+        Execute up to cycles instructions
+
+        Parameters
+        ----------
+        cycles: int
+            Maximum number of instructions to execute
+        stopOnHalt: bool
+            Stop at the jump of an '(END) @END 0;JMP' loop
+
+        Returns
+        -------
+        int
+            Number of instructions executed
+        """
+        decoded = self.decoded
+        ram = self.ram
+        a, d, pc = self.A, self.D, self.PC
+        n = 0
+
+        while n < cycles:
+            n += 1
+            comp, readM, dest, jump, value = decoded[pc]
+            if comp is None:
+                a = value
+                pc = (pc + 1) & 0x7FFF
+                continue
+
+            address = a & 0x7FFF
+            y = comp(a, d, ram[address] if readM else 0)
+            if dest:
+                if dest & 0b001:
+                    ram[address] = y
+                if dest & 0b010:
+                    d = y
+                if dest & 0b100:
+                    a = y
+
+            if jump and jump & (JEQ if y == 0 else (JLT if y & 0x8000 else JGT)):
+                if jump & HALT and stopOnHalt:
+                    self.halted = True
+                    break
+                pc = address
+            else:
+                pc = (pc + 1) & 0x7FFF
+
+        self.A, self.D, self.PC = a, d, pc
+        self.cycles += n
+        return n
+
+    def step(self):
+        return self.run(1, stopOnHalt=False)
+
+
+class JitMachine(HackMachine):
+    """
+    Hack machine that translates blocks of straight-line code into Python functions.
+
+    A block starts at any address execution reaches and runs up to and
+    including its first unconditional jump. Conditional jumps leave the block
+    early when taken and fall through into the rest of it otherwise. Each
+    block is generated as Python source, compiled once, and cached by its ROM
+    address until the machine is reset or reloaded.
+    """
+    MAX_BLOCK = 64
+
+    def load(self, program):
+        self.blocks = [None] * ROM_SIZE
+        super().load(program)
+
+    def reset(self):
+        super().reset()
+        self.blocks = [None] * ROM_SIZE
+
+    def compileBlock(self, start):
+        """
+        Generate and compile the block starting at ROM address start
+
+        Returns
+        -------
+        tuple
+            Block function of (a, d, ram) returning (a, d, pc, instructions
+            executed), and the most instructions it can execute. The function
+            is None when the instruction at start must be interpreted.
+        """
+        code = ['def block(a, d, ram):']
+        knownA = None  # Value of A, when set by an A-instruction within the block
+        pc = start
+        length = 0
+
+        while length < self.MAX_BLOCK:
+            comp, readM, dest, jump, value = self.decoded[pc]
+            if jump & HALT:
+                break
+            length += 1
+            pc = (pc + 1) & 0x7FFF
+
+            if comp is None:
+                code.append('    a = {}'.format(value))
+                knownA = value
+                continue
+
+            address = 'a & 0x7FFF' if knownA is None else str(knownA & 0x7FFF)
+            code.append('    y = ' + COMP_EXPR[(self.rom[pc - 1] >> 6) & 0x7F].format(m='ram[{}]'.format(address)))
+            if jump:
+                code.append('    target = {}'.format(address))
+            if dest & 0b001:
+                code.append('    ram[{}] = y'.format(address))
+            if dest & 0b010:
+                code.append('    d = y')
+            if dest & 0b100:
+                code.append('    a = y')
+                knownA = None
+
+            if jump == JLT | JEQ | JGT:
+                code.append('    return a, d, target, {}'.format(length))
+                break
+            elif jump:
+                code.append('    if {}:'.format(JUMP_EXPR[jump]))
+                code.append('        return a, d, target, {}'.format(length))
+
+        if not length:
+            return None, 1
+
+        code.append('    return a, d, {}, {}'.format(pc, length))
+        namespace = {}
+        exec(compile('\n'.join(code), '<block {}>'.format(start), 'exec'), namespace)
+        return namespace['block'], length
+
+    def run(self, cycles, stopOnHalt=True):
+        """
+        Execute up to cycles instructions, a whole block at a time. Blocks
+        longer than the remaining budget are interpreted instruction by
+        instruction, so exactly cycles instructions are executed.
+        """
+        blocks = self.blocks
+        ram = self.ram
+        a, d, pc = self.A, self.D, self.PC
+        n = 0
+
+        while n < cycles:
+            block = blocks[pc]
+            if block is None:
+                block = blocks[pc] = self.compileBlock(pc)
+            function, length = block
+
+            if length > cycles - n or function is None:
+                self.A, self.D, self.PC = a, d, pc
+                n += HackMachine.run(self, 1, stopOnHalt)
+                self.cycles -= 1
+                a, d, pc = self.A, self.D, self.PC
+                if self.halted:
+                    break
+                continue
+
+            a, d, pc, executed = function(a, d, ram)
+            n += executed
+
+        self.A, self.D, self.PC = a, d, pc
+        self.cycles += n
+        return n
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('filename', help="The .hack, .bin or .asm program to run")
+    argParser.add_argument('--cycles', type=int, default=1000000, help="Maximum number of instructions to execute")
+    argParser.add_argument('--byteorder', choices=['little', 'big'], default='little', help="Byte order of .bin programs")
+    argParser.add_argument('--set', nargs='*', default=[], metavar='ADDR=VAL', help="Initial RAM values")
+    argParser.add_argument('--jit', action='store_true', help="Compile basic blocks into Python functions")
+    argParser.add_argument('--dump', nargs='*', type=int, default=[], metavar='ADDR', help="RAM addresses to print when done")
+    args = argParser.parse_args()
+
+    machineClass = JitMachine if args.jit else HackMachine
+    machine = machineClass(loadProgram(args.filename, args.byteorder))
+    for assignment in args.set:
+        address, val = assignment.split('=')
+        machine.ram[int(address)] = int(val) & 0xFFFF
+
+    start = time.perf_counter()
+    n = machine.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    print("{} instructions in {:.3f}s ({:.2f} MIPS){}".format(
+        n, elapsed, n / elapsed / 1e6, ", halted" if machine.halted else ""))
+    for address in args.dump:
+        print("RAM[{}] = {}".format(address, signed(machine.ram[address])))
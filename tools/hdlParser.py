@@ -0,0 +1,283 @@
+"""
+Parser for the nand2tetris hardware description language
+"""
+
+import re
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Directories searched for chip definitions, after the directory of the chip being loaded
+SEARCH_PATH = [ROOT / '01', ROOT / '02', ROOT / '03' / 'a', ROOT / '03' / 'b', ROOT / '05']
+
+# Chips the simulator implements natively
+PRIMITIVES = {
+    'Nand': 'CHIP Nand { IN a, b; OUT out; BUILTIN Nand; }',
+    'DFF': 'CHIP DFF { IN in; OUT out; BUILTIN DFF; CLOCKED in; }',
+}
+
+# Builtin chips that behave exactly like a chip of the library
+ALIASES = {
+    'ARegister': 'Register',
+    'DRegister': 'Register',
+}
+
+TOKENS = re.compile(r'''
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<range>\.\.)
+  | (?P<number>\d+)
+  | (?P<name>[A-Za-z_][\w.]*)
+  | (?P<symbol>[{}()\[\],;=:])
+''', re.VERBOSE | re.DOTALL)
+
+
+class HDLError(ValueError):
+    pass
+
+
+class ChipDef(object):
+    """
+    A parsed CHIP declaration.
+
+    inputs and outputs map pin names to widths, in declaration order. Parts
+    hold (chip name, connections) pairs, each connection being a tuple of
+    (pin, pin range, signal, signal range), where a range is an inclusive
+    (low, high) pair of bit indices or None for the whole bus.
+    """
+    def __init__(self, name, filename=None):
+        self.name = name
+        self.filename = filename
+        self.inputs = {}
+        self.outputs = {}
+        self.parts = []
+        self.builtin = None
+        self.clocked = []
+
+    def width(self, pin):
+        if pin in self.inputs:
+            return self.inputs[pin]
+        if pin in self.outputs:
+            return self.outputs[pin]
+        raise HDLError("Chip {} has no pin named {}".format(self.name, pin))
+
+
+def tokenize(text):
+    """
+    Split HDL source into (kind, value, line) tuples, dropping comments
+    """
+    pos = 0
+    line = 1
+    while pos < len(text):
+        match = TOKENS.match(text, pos)
+        if match is None:
+            raise HDLError("Line {}: unexpected character {!r}".format(line, text[pos]))
+        kind = match.lastgroup
+        value = match.group()
+        if kind not in ['comment', 'space']:
+            yield kind, value, line
+        line += value.count('\n')
+        pos = match.end()
+
+
+class HDLParser(object):
+    """
+    Recursive descent parser over the token stream of a single .hdl file
+    """
+    def __init__(self, text, filename=None):
+        self.tokens = list(tokenize(text))
+        self.pos = 0
+        self.filename = filename
+
+    def error(self, message):
+        line = self.tokens[min(self.pos, len(self.tokens) - 1)][2] if self.tokens else 1
+        raise HDLError("{}:{}: {}".format(self.filename or '<hdl>', line, message))
+
+    @property
+    def current(self):
+        if self.pos >= len(self.tokens):
+            self.error("Unexpected end of file")
+        return self.tokens[self.pos][1]
+
+    def advance(self):
+        value = self.current
+        self.pos += 1
+        return value
+
+    def expect(self, value):
+        if self.current != value:
+            self.error("Expected {!r} but found {!r}".format(value, self.current))
+        return self.advance()
+
+    def name(self):
+        if self.tokens[self.pos][0] != 'name':
+            self.error("Expected a name but found {!r}".format(self.current))
+        return self.advance()
+
+    def number(self):
+        if self.tokens[self.pos][0] != 'number':
+            self.error("Expected a number but found {!r}".format(self.current))
+        return int(self.advance())
+
+    def parse(self):
+        self.expect('CHIP')
+        chip = ChipDef(self.name(), self.filename)
+        self.expect('{')
+
+        while self.current != '}':
+            keyword = self.advance()
+            if keyword == 'IN':
+                chip.inputs.update(self.pinList())
+            elif keyword == 'OUT':
+                chip.outputs.update(self.pinList())
+            elif keyword == 'PARTS':
+                self.expect(':')
+                while self.current not in ['}', 'BUILTIN', 'CLOCKED']:
+                    chip.parts.append(self.part())
+            elif keyword == 'BUILTIN':
+                chip.builtin = self.name()
+                self.expect(';')
+            elif keyword == 'CLOCKED':
+                chip.clocked = list(self.pinList())
+            else:
+                self.pos -= 1
+                self.error("Unexpected {!r}".format(keyword))
+        self.expect('}')
+        return chip
+
+    def pinList(self):
+        """
+        Comma separated pin declarations, e.g., a, b[16];
+
+        Yields
+        ------
+        tuple
+            Pin name and width
+        """
+        while True:
+            name = self.name()
+            width = 1
+            if self.current == '[':
+                self.advance()
+                width = self.number()
+                self.expect(']')
+            yield name, width
+            if self.advance() == ';':
+                return
+            self.pos -= 1
+            self.expect(',')
+
+    def part(self):
+        chipName = self.name()
+        connections = []
+        self.expect('(')
+        while True:
+            pin, pinRange = self.reference()
+            self.expect('=')
+            signal, signalRange = self.reference()
+            connections.append((pin, pinRange, signal, signalRange))
+            if self.advance() == ')':
+                break
+            self.pos -= 1
+            self.expect(',')
+        self.expect(';')
+        return chipName, connections
+
+    def reference(self):
+        """
+        A pin or signal with an optional sub-bus, e.g., a, a[3] or a[0..7]
+        """
+        name = self.name()
+        if self.current != '[':
+            return name, None
+        self.advance()
+        low = high = self.number()
+        if self.current == '..':
+            self.advance()
+            high = self.number()
+        self.expect(']')
+        if high < low:
+            self.error("Invalid sub-bus {}[{}..{}]".format(name, low, high))
+        return name, (low, high)
+
+
+def parseHDL(text, filename=None):
+    return HDLParser(text, filename).parse()
+
+
+class ChipLibrary(object):
+    """
+    Finds, parses and caches chip definitions by name.
+
+    Chips are looked up in the given directories, then the project
+    directories 01 to 05, so a chip under test is always preferred over the
+    library version of itself. builtins maps the names of chips that may
+    have no .hdl file to HDL declaring their pins.
+    """
+    def __init__(self, directories=(), builtins=None):
+        self.path = [Path(directory) for directory in directories] + SEARCH_PATH
+        self.builtins = builtins or {}
+        self.chips = {}
+
+    def find(self, name):
+        for directory in self.path:
+            filename = directory / '{}.hdl'.format(name)
+            if filename.exists():
+                return filename
+        return None
+
+    def get(self, name):
+        """
+        Returns
+        -------
+        ChipDef
+            The definition of chip name
+        """
+        if name not in self.chips:
+            if name in PRIMITIVES:
+                chip = parseHDL(PRIMITIVES[name], '<{}>'.format(name))
+            elif name in ALIASES:
+                chip = self.get(ALIASES[name])
+            else:
+                filename = self.find(name)
+                if filename is not None:
+                    chip = parseHDL(filename.read_text(), str(filename))
+                elif name in self.builtins:
+                    chip = parseHDL(self.builtins[name], '<{}>'.format(name))
+                else:
+                    raise HDLError("Chip {} not found".format(name))
+                if chip.name != name:
+                    raise HDLError("{} defines chip {} instead of {}".format(filename, chip.name, name))
+            self.chips[name] = chip
+        return self.chips[name]
+
+    def dependencies(self, name):
+        """
+        Returns
+        -------
+        list
+            Sorted paths of the .hdl files chip name is built from, its own
+            included, across its whole hierarchy of parts
+        """
+        files = set()
+        seen = set()
+        pending = [name]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            chip = self.get(name)
+            filename = self.find(chip.name)
+            if filename is not None:
+                files.add(filename)
+            pending.extend(part for part, _ in chip.parts)
+        return sorted(files)
+
+    @classmethod
+    def forFile(cls, filename, builtins=None):
+        """
+        Library searching the directory of filename first
+        """
+        return cls([Path(filename).resolve().parent], builtins)
@@ -0,0 +1,480 @@
+"""
+Gate-level simulator for chips written in the nand2tetris HDL
+"""
+
+import sys
+import time
+import base64
+import random
+import marshal
+import argparse
+from pathlib import Path
+
+from hdlParser import ChipLibrary, HDLError
+from builtinChips import BUILTIN_CHIPS, BUILTIN_HDL
+from chipCache import CACHE_DIR, ChipCache
+
+
+# Wires 0 and 1 carry the constants false and true
+FALSE = 0
+TRUE = 1
+
+
+class Netlist(object):
+    """
+    A chip flattened into Nand gates and DFFs over numbered one-bit wires.
+
+    nands holds (a, b, out) wire triples, dffs (in, out) pairs and parts the
+    behavioural models standing in for memory chips. inputs, outputs and
+    internals map the pin names of the top-level chip to lists of wires,
+    least significant bit first.
+
+    While the chip is flattened, wires that a part output connects to more
+    than one signal are merged with a union-find over parent, and compact
+    renumbers the surviving wires densely once flattening is done.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.wires = 2
+        self.parent = [FALSE, TRUE]
+        self.nands = []
+        self.dffs = []
+        self.parts = []
+        self.inputs = {}
+        self.outputs = {}
+        self.internals = {}
+
+    def newBus(self, width):
+        bus = list(range(self.wires, self.wires + width))
+        self.parent.extend(bus)
+        self.wires += width
+        return bus
+
+    def find(self, wire):
+        parent = self.parent
+        while parent[wire] != wire:
+            parent[wire] = parent[parent[wire]]
+            wire = parent[wire]
+        return wire
+
+    def join(self, a, b):
+        self.parent[self.find(b)] = self.find(a)
+
+    def compact(self):
+        """
+        Resolve merged wires and renumber them from 2 upwards
+        """
+        index = {FALSE: FALSE, TRUE: TRUE}
+
+        def resolve(wire):
+            wire = self.find(wire)
+            if wire not in index:
+                index[wire] = len(index)
+            return index[wire]
+
+        self.nands = [(resolve(a), resolve(b), resolve(out)) for a, b, out in self.nands]
+        self.dffs = [(resolve(d), resolve(q)) for d, q in self.dffs]
+        for pins in [self.inputs, self.outputs, self.internals] + [part.pins for part in self.parts]:
+            for name, bus in pins.items():
+                pins[name] = [resolve(wire) for wire in bus]
+        self.wires = len(index)
+        self.parent = None
+
+        drivers = [out for _, _, out in self.nands] + [q for _, q in self.dffs]
+        drivers += [wire for part in self.parts for pin in part.outputs for wire in part.pins[pin]]
+        if len(set(drivers)) != len(drivers) or FALSE in drivers or TRUE in drivers:
+            raise HDLError("Chip {} drives a wire from more than one part".format(self.name))
+
+    def serialize(self, levels):
+        """
+        Returns
+        -------
+        dict
+            JSON compatible form of the netlist and its levels, where levels
+            refer to gates and parts by their index in nands + parts
+        """
+        index = {id(node): i for i, node in enumerate(self.nands + self.parts)}
+        return {
+            'name': self.name,
+            'wires': self.wires,
+            'nands': self.nands,
+            'dffs': self.dffs,
+            'parts': [(part.name, part.pins) for part in self.parts],
+            'inputs': self.inputs,
+            'outputs': self.outputs,
+            'internals': self.internals,
+            'levels': [[index[id(node)] for node in level] for level in levels],
+        }
+
+    @classmethod
+    def deserialize(cls, data):
+        """
+        Returns
+        -------
+        tuple
+            Netlist and levels, from the form returned by serialize
+        """
+        netlist = cls(data['name'])
+        netlist.wires = data['wires']
+        netlist.parent = None
+        netlist.nands = [tuple(gate) for gate in data['nands']]
+        netlist.dffs = [tuple(dff) for dff in data['dffs']]
+        netlist.parts = [BUILTIN_CHIPS[name](name, pins) for name, pins in data['parts']]
+        netlist.inputs = data['inputs']
+        netlist.outputs = data['outputs']
+        netlist.internals = data['internals']
+        nodes = netlist.nands + netlist.parts
+        return netlist, [[nodes[i] for i in level] for level in data['levels']]
+
+    def pin(self, name):
+        for pins in (self.inputs, self.outputs, self.internals):
+            if name in pins:
+                return pins[name]
+        raise HDLError("Chip {} has no pin named {}".format(self.name, name))
+
+
+def flatten(library, name, pins, netlist, forceGate=False):
+    """
+    Expand a chip into primitive gates and behavioural models of netlist
+
+    Parameters
+    ----------
+    library: ChipLibrary
+        Definitions of the parts
+    name: str
+        Name of the chip to expand
+    pins: dict
+        Wires of every input and output pin of the chip
+    netlist: Netlist
+        Netlist receiving the gates
+    forceGate: bool
+        Expand memory chips used as parts into gates rather than
+        substituting their behavioural models, which are then only used for
+        builtins with no .hdl file such as Screen
+
+    Returns
+    -------
+    dict
+        Wires of every pin and internal signal of the chip
+    """
+    chip = library.get(name)
+    if chip.builtin == 'Nand':
+        netlist.nands.append((pins['a'][0], pins['b'][0], pins['out'][0]))
+        return pins
+    if chip.builtin == 'DFF':
+        netlist.dffs.append((pins['in'][0], pins['out'][0]))
+        return pins
+    if chip.builtin is not None and name in BUILTIN_CHIPS:
+        # Declared by BUILTIN_HDL, there is no .hdl file to expand
+        netlist.parts.append(BUILTIN_CHIPS[name](name, pins))
+        return pins
+    if not chip.parts:
+        raise HDLError("Chip {} has no gate-level implementation".format(chip.name))
+
+    signals = dict(pins)
+    parts = [(name, library.get(name), connections) for name, connections in chip.parts]
+
+    # Internal signals take the width of the part output driving them
+    driven = set()
+    for _, part, connections in parts:
+        for pin, pinRange, signal, signalRange in connections:
+            if pin not in part.outputs:
+                continue
+            if signal in chip.inputs or signal in ['true', 'false']:
+                raise HDLError("{}: {}.{} cannot drive {}".format(chip.name, part.name, pin, signal))
+            if signal in chip.outputs:
+                if signal in driven and signalRange is None:
+                    raise HDLError("{}: {} has more than one driver".format(chip.name, signal))
+            elif signal in driven:
+                raise HDLError("{}: {} has more than one driver".format(chip.name, signal))
+            elif signalRange is not None:
+                raise HDLError("{}: sub-bus of internal signal {}".format(chip.name, signal))
+            else:
+                width = part.width(pin) if pinRange is None else pinRange[1] - pinRange[0] + 1
+                signals[signal] = netlist.newBus(width)
+            driven.add(signal)
+
+    for partName, part, connections in parts:
+        partPins = {pin: [FALSE] * width for pin, width in part.inputs.items()}
+        partPins.update({pin: [None] * width for pin, width in part.outputs.items()})
+
+        for pin, pinRange, signal, signalRange in connections:
+            width = part.width(pin)
+            low, high = pinRange or (0, width - 1)
+            if high >= width:
+                raise HDLError("{}: {}.{}[{}] is out of range".format(chip.name, part.name, pin, high))
+
+            if signal in ['true', 'false']:
+                bits = [TRUE if signal == 'true' else FALSE] * (high - low + 1)
+            else:
+                if signal not in signals:
+                    raise HDLError("{}: signal {} is never driven".format(chip.name, signal))
+                bits = signals[signal]
+                if signalRange is not None:
+                    if signalRange[1] >= len(bits):
+                        raise HDLError("{}: {}[{}] is out of range".format(chip.name, signal, signalRange[1]))
+                    bits = bits[signalRange[0]:signalRange[1] + 1]
+            if len(bits) != high - low + 1:
+                raise HDLError("{}: width of {} does not match {}.{}".format(chip.name, signal, part.name, pin))
+
+            bus = partPins[pin]
+            for i, wire in enumerate(bits, low):
+                if pin in part.inputs or bus[i] is None:
+                    bus[i] = wire
+                else:
+                    netlist.join(bus[i], wire)
+
+        for pin in part.outputs:
+            bus = partPins[pin]
+            for i, wire in enumerate(bus):
+                if wire is None:
+                    bus[i] = netlist.newBus(1)[0]
+        if partName in BUILTIN_CHIPS and not forceGate:
+            netlist.parts.append(BUILTIN_CHIPS[partName](partName, partPins))
+        else:
+            flatten(library, partName, partPins, netlist, forceGate)
+
+    return signals
+
+
+def flattenChip(library, name, forceGate=False):
+    """
+    Flatten the chip name, found through library, into a Netlist
+    """
+    chip = library.get(name)
+    netlist = Netlist(chip.name)
+    netlist.inputs = {pin: netlist.newBus(width) for pin, width in chip.inputs.items()}
+    netlist.outputs = {pin: netlist.newBus(width) for pin, width in chip.outputs.items()}
+    signals = flatten(library, name, dict(netlist.inputs, **netlist.outputs), netlist, forceGate)
+    netlist.internals = {name: bus for name, bus in signals.items()
+                         if name not in chip.inputs and name not in chip.outputs}
+    netlist.compact()
+    return netlist
+
+
+def levelize(netlist):
+    """
+    Order the Nand gates and behavioural parts so each is evaluated after
+    the gates driving its inputs
+
+    Returns
+    -------
+    list
+        Levels of (a, b, out) gates and parts. Level 0 only reads inputs,
+        constants and DFF outputs, level n reads outputs of level n - 1 or
+        below. Parts only depend on their combinational inputs.
+    """
+    nodes = netlist.nands + netlist.parts
+    reads = [(a, b) for a, b, _ in netlist.nands]
+    reads += [[wire for pin in part.combinational for wire in part.pins[pin]] for part in netlist.parts]
+    driver = {out: i for i, (_, _, out) in enumerate(netlist.nands)}
+    for i, part in enumerate(netlist.parts, len(netlist.nands)):
+        driver.update((wire, i) for pin in part.outputs for wire in part.pins[pin])
+
+    fanout = {}
+    pending = []
+    for i, wires in enumerate(reads):
+        sources = [driver[wire] for wire in wires if wire in driver]
+        for source in sources:
+            fanout.setdefault(source, []).append(i)
+        pending.append(len(sources))
+
+    levels = []
+    ready = [i for i, count in enumerate(pending) if count == 0]
+    done = 0
+    while ready:
+        levels.append([nodes[i] for i in ready])
+        done += len(ready)
+        following = []
+        for i in ready:
+            for j in fanout.get(i, []):
+                pending[j] -= 1
+                if pending[j] == 0:
+                    following.append(j)
+        ready = following
+
+    if done != len(nodes):
+        raise HDLError("Chip {} contains a combinational loop".format(netlist.name))
+    return levels
+
+
+class Simulator(object):
+    """
+    Clocked simulation of a flattened chip.
+
+    Nand gates are evaluated in levelized order, computed once, so a single
+    pass settles every wire. As in the nand2tetris HardwareSimulator, tick
+    latches the DFF inputs and tock updates the DFF outputs. Behavioural
+    parts are evaluated among the gates and clocked alongside the DFFs.
+
+    The simulation is bitsliced: every wire holds a Python int whose bit k is
+    the value of the wire in lane k, so a batch of lanes independent input
+    vectors is evaluated with one pass over the gates. Scalar pin access
+    broadcasts to all lanes and reads lane 0. Behavioural parts hold a single
+    state, so they need a single lane.
+    """
+    def __init__(self, netlist, lanes=1, levels=None, code=None):
+        if lanes > 1 and netlist.parts:
+            raise HDLError("Chip {} uses behavioural parts, which cannot be bitsliced".format(netlist.name))
+        self.netlist = netlist
+        self.lanes = lanes
+        self.mask = (1 << lanes) - 1
+        self.levels = levels or levelize(netlist)
+        self.order = [gate for level in self.levels for gate in level]
+        self.evaluate = self.compile(code)
+        self.values = [0] * netlist.wires
+        self.values[TRUE] = self.mask
+        self.state = [0] * len(netlist.dffs)
+        self.time = 0
+
+    @classmethod
+    def fromFile(cls, filename, lanes=1, forceGate=False, cacheDir=None):
+        """
+        Simulator of the chip defined in filename. With a cacheDir, the
+        flattened and levelized chip and its compiled evaluation code are
+        reused until the simulator or any .hdl file it is built from changes.
+        """
+        library = ChipLibrary.forFile(filename, BUILTIN_HDL)
+        name = Path(filename).stem
+        if cacheDir is None:
+            return cls(flattenChip(library, name, forceGate), lanes)
+
+        # Code objects are specific to the Python version
+        cache = ChipCache(cacheDir)
+        key = cache.key(library, name, forceGate, sys.implementation.cache_tag)
+        data = cache.get(filename, key, forceGate)
+        if data is not None:
+            netlist, levels = Netlist.deserialize(data)
+            return cls(netlist, lanes, levels, marshal.loads(base64.b64decode(data['code'])))
+        netlist = flattenChip(library, name, forceGate)
+        simulator = cls(netlist, lanes)
+        data = netlist.serialize(simulator.levels)
+        data['code'] = base64.b64encode(marshal.dumps(simulator.code)).decode()
+        cache.put(filename, key, data, forceGate)
+        return simulator
+
+    def compile(self, code=None):
+        """
+        Generate straight-line Python evaluating the gates and parts in order
+
+        Parameters
+        ----------
+        code: code or None
+            The code object of an earlier compile of the same netlist,
+            e.g., from the chip cache
+
+        Returns
+        -------
+        function
+            Function of (values, mask) updating values in place
+        """
+        if code is None:
+            parts = {id(part): i for i, part in enumerate(self.netlist.parts)}
+            source = ['def evaluate(v, mask):']
+            for node in self.order:
+                if isinstance(node, tuple):
+                    source.append('    v[{2}] = mask ^ (v[{0}] & v[{1}])'.format(*node))
+                else:
+                    source.append('    parts[{}].eval(v)'.format(parts[id(node)]))
+            source.append('    return v')
+            code = compile('\n'.join(source), '<{}>'.format(self.netlist.name), 'exec')
+        self.code = code
+        namespace = {'parts': self.netlist.parts}
+        exec(code, namespace)
+        return namespace['evaluate']
+
+    def __setitem__(self, name, value):
+        for i, wire in enumerate(self.netlist.pin(name)):
+            self.values[wire] = self.mask if (value >> i) & 1 else 0
+
+    def __getitem__(self, name):
+        return sum((self.values[wire] & 1) << i for i, wire in enumerate(self.netlist.pin(name)))
+
+    def setLanes(self, name, values):
+        """
+        Set pin name to values[k] in lane k
+        """
+        for i, wire in enumerate(self.netlist.pin(name)):
+            bits = ''.join('1' if (value >> i) & 1 else '0' for value in reversed(values))
+            self.values[wire] = int(bits or '0', 2)
+
+    def getLanes(self, name):
+        """
+        Returns
+        -------
+        list
+            Value of pin name in every lane
+        """
+        values = [0] * self.lanes
+        for i, wire in enumerate(self.netlist.pin(name)):
+            bits = format(self.values[wire], '0{}b'.format(self.lanes))
+            for k, bit in enumerate(reversed(bits)):
+                if bit == '1':
+                    values[k] |= 1 << i
+        return values
+
+    def part(self, name):
+        """
+        Returns
+        -------
+        BuiltinChip
+            The first behavioural part of the chip named name, e.g., RAM16K
+        """
+        for part in self.netlist.parts:
+            if part.name == name:
+                return part
+        raise HDLError("Chip {} has no builtin part {}".format(self.netlist.name, name))
+
+    def eval(self):
+        self.evaluate(self.values, self.mask)
+
+    def tick(self):
+        self.eval()
+        self.state = [self.values[d] for d, _ in self.netlist.dffs]
+        for part in self.netlist.parts:
+            part.tick(self.values)
+
+    def tock(self):
+        for (_, q), bits in zip(self.netlist.dffs, self.state):
+            self.values[q] = bits
+        for part in self.netlist.parts:
+            part.tock()
+        self.eval()
+        self.time += 1
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('filename', help="The .hdl file of the chip to simulate")
+    argParser.add_argument('--set', nargs='*', default=[], metavar='PIN=VAL', help="Input pin values")
+    argParser.add_argument('--clocks', type=int, default=0, help="Number of clock cycles to run after setting the inputs")
+    argParser.add_argument('--random', type=int, default=0, metavar='N', help="Time one batch of N random input vectors")
+    argParser.add_argument('--force-gate', action='store_true', help="Simulate memory chips at gate level, never substituting their models")
+    argParser.add_argument('--chip-cache', default=str(CACHE_DIR), metavar='DIR', help="Directory of flattened chips, empty to disable")
+    args = argParser.parse_args()
+
+    start = time.perf_counter()
+    simulator = Simulator.fromFile(args.filename, max(args.random, 1), args.force_gate, args.chip_cache or None)
+    elapsed = time.perf_counter() - start
+    netlist = simulator.netlist
+    print("{}: {} Nand gates, {} DFFs, {} builtin parts, {} levels, built in {:.3f}s".format(
+        netlist.name, len(netlist.nands), len(netlist.dffs), len(netlist.parts), len(simulator.levels), elapsed))
+
+    if args.random:
+        for pin, bus in netlist.inputs.items():
+            simulator.setLanes(pin, [random.getrandbits(len(bus)) for _ in range(args.random)])
+        start = time.perf_counter()
+        simulator.eval()
+        elapsed = time.perf_counter() - start
+        print("{} vectors in {:.3f}s ({:.0f} vectors/s)".format(args.random, elapsed, args.random / elapsed))
+
+    for assignment in args.set:
+        pin, val = assignment.split('=')
+        simulator[pin] = int(val)
+    simulator.eval()
+    for _ in range(args.clocks):
+        simulator.tick()
+        simulator.tock()
+
+    for pin in netlist.outputs:
+        print("{} = {}".format(pin, simulator[pin]))
@@ -0,0 +1,405 @@
+"""
+Runs nand2tetris .tst test scripts and compares their output with .cmp files
+"""
+
+import re
+import sys
+import time
+import argparse
+from pathlib import Path
+
+from hdlParser import HDLError
+from hdlSimulator import Simulator
+from eventSimulator import EventSimulator
+from chipCache import CACHE_DIR
+from hackEmulator import JitMachine, loadProgram, signed
+
+TOKENS = re.compile(r'//[^\n]*|/\*.*?\*/|"[^"]*"|[{},;!]|[^\s{},;!]+', re.DOTALL)
+OUTPUT_FORMAT = re.compile(r'^(.+)%([BDSX])(\d+)\.(\d+)\.(\d+)$')
+INDEXED = re.compile(r'^(\w+)\[(\d*)\]$')
+
+# Simulation engines for chips
+ENGINES = {
+    'levelized': Simulator,
+    'event': EventSimulator,
+}
+
+# Iterations after which a while loop is taken to be waiting for user input
+WHILE_LIMIT = 100000
+
+
+class TestError(Exception):
+    pass
+
+
+class ComparisonError(TestError):
+    pass
+
+
+class UnsupportedError(TestError):
+    """
+    The script needs a tool or user interaction this runner does not provide
+    """
+    pass
+
+
+def parseValue(text):
+    """
+    Parse a test script value, e.g., -1, %X2000, %B0101 or %D99
+    """
+    try:
+        if text.startswith('%X'):
+            return int(text[2:], 16)
+        if text.startswith('%B'):
+            return int(text[2:], 2)
+        if text.startswith('%D'):
+            return int(text[2:])
+        return int(text)
+    except ValueError:
+        raise TestError("Invalid value {}".format(text))
+
+
+def parseScript(text):
+    """
+    Parse a test script into a list of commands. Commands are lists of words,
+    apart from ('repeat', count, body) and ('while', condition, body) blocks.
+    """
+    tokens = [token for token in TOKENS.findall(text) if not token.startswith('/')]
+    commands, pos = parseBlock(tokens, 0)
+    if pos != len(tokens):
+        raise TestError("Unexpected '}'")
+    return commands
+
+
+def parseBlock(tokens, pos):
+    commands = []
+    words = []
+    while pos < len(tokens) and tokens[pos] != '}':
+        token = tokens[pos]
+        pos += 1
+        if token == '{':
+            if not words or words[0] not in ['repeat', 'while']:
+                raise TestError("Unexpected '{' after {}".format(' '.join(words)))
+            body, pos = parseBlock(tokens, pos)
+            if pos == len(tokens):
+                raise TestError("Missing '}'")
+            pos += 1
+            if words[0] == 'repeat':
+                commands.append(('repeat', int(words[1]) if len(words) > 1 else None, body))
+            else:
+                commands.append(('while', words[1:], body))
+            words = []
+        elif token in [',', ';', '!']:
+            if words:
+                commands.append(words)
+            words = []
+        else:
+            words.append(token)
+    if words:
+        commands.append(words)
+    return commands, pos
+
+
+class OutputColumn(object):
+    """
+    A variable of the output-list, e.g., RAM[0]%D2.6.2, formatted in a
+    column of left padding, length and right padding characters
+    """
+    def __init__(self, spec):
+        match = OUTPUT_FORMAT.match(spec)
+        if match is None:
+            raise TestError("Invalid output format {}".format(spec))
+        self.name, self.format = match.group(1), match.group(2)
+        self.left, self.length, self.right = (int(match.group(i)) for i in range(3, 6))
+
+    @property
+    def header(self):
+        width = self.left + self.length + self.right
+        name = self.name[:width]
+        left = (width - len(name)) // 2
+        return ' ' * left + name + ' ' * (width - left - len(name))
+
+    def cell(self, value):
+        if self.format == 'S':
+            text = str(value).ljust(self.length)
+        elif self.format == 'D':
+            text = str(value).rjust(self.length)
+        elif self.format == 'B':
+            text = format(value & ((1 << self.length) - 1), '0{}b'.format(self.length))
+        else:
+            text = format(value & ((1 << 4 * self.length) - 1), '0{}X'.format(self.length))
+        return ' ' * self.left + text[-self.length:] + ' ' * self.right
+
+
+class HardwareTarget(object):
+    """
+    Test script variables of a chip simulated by the HDL simulator: pins,
+    builtin part state such as RAM16K[3] or DRegister[], and time
+    """
+    def __init__(self, filename, forceGate=False, cacheDir=None, engine='levelized'):
+        try:
+            self.simulator = ENGINES[engine].fromFile(str(filename), forceGate=forceGate, cacheDir=cacheDir)
+        except HDLError as e:
+            raise TestError(str(e))
+        self.time = '0'
+
+    def get(self, name):
+        if name == 'time':
+            return self.time
+        match = INDEXED.match(name)
+        if match:
+            return signed(self.simulator.part(match.group(1))[int(match.group(2) or 0)])
+        value = self.simulator[name]
+        return signed(value) if len(self.simulator.netlist.pin(name)) == 16 else value
+
+    def set(self, name, value):
+        match = INDEXED.match(name)
+        if match:
+            self.simulator.part(match.group(1))[int(match.group(2) or 0)] = value
+        else:
+            self.simulator[name] = value & ((1 << len(self.simulator.netlist.pin(name))) - 1)
+
+    def command(self, words):
+        simulator = self.simulator
+        if words == ['eval']:
+            simulator.eval()
+        elif words == ['tick']:
+            simulator.tick()
+            self.time = '{}+'.format(simulator.time)
+        elif words == ['tock']:
+            simulator.tock()
+            self.time = str(simulator.time)
+        elif len(words) == 3 and words[1] == 'load':
+            simulator.part(words[0]).load(words[2])
+            simulator.eval()
+        else:
+            return False
+        return True
+
+    def run(self, count):
+        for _ in range(count):
+            self.command(['tick'])
+            self.command(['tock'])
+
+
+class CPUTarget(object):
+    """
+    Test script variables of the Hack computer, as in the CPUEmulator: A, D,
+    PC, RAM[i], ROM[i] and time
+    """
+    def __init__(self, filename):
+        self.machine = JitMachine(loadProgram(str(filename)))
+        self.time = 0
+
+    def get(self, name):
+        machine = self.machine
+        if name == 'time':
+            return self.time
+        if name in ['A', 'D', 'PC']:
+            return signed(getattr(machine, name) & 0xFFFF)
+        match = INDEXED.match(name)
+        if match and match.group(1) in ['RAM', 'ROM'] and match.group(2):
+            memory = machine.ram if match.group(1) == 'RAM' else machine.rom
+            return signed(memory[int(match.group(2))])
+        raise TestError("Unknown variable {}".format(name))
+
+    def set(self, name, value):
+        machine = self.machine
+        match = INDEXED.match(name)
+        if name in ['A', 'D']:
+            setattr(machine, name, value & 0xFFFF)
+        elif name == 'PC':
+            machine.PC = value & 0x7FFF
+        elif match and match.group(1) == 'RAM' and match.group(2):
+            machine.ram[int(match.group(2))] = value & 0xFFFF
+        else:
+            raise TestError("Cannot set {}".format(name))
+
+    def command(self, words):
+        if words == ['ticktock'] or words == ['tock']:
+            self.run(1)
+        elif words == ['tick']:
+            pass
+        else:
+            return False
+        return True
+
+    def run(self, count):
+        self.machine.run(count, stopOnHalt=False)
+        self.time += count
+
+
+class TestScript(object):
+    """
+    Interpreter of a .tst script.
+
+    Every output line is written to the output file and compared with the
+    next line of the compare file as soon as it is produced, so a run stops
+    at the first mismatch. '*' characters in the compare file match anything.
+    """
+    def __init__(self, filename, forceGate=False, cacheDir=None, engine='levelized'):
+        self.filename = Path(filename)
+        self.directory = self.filename.parent
+        self.forceGate = forceGate
+        self.cacheDir = cacheDir
+        self.engine = engine
+        self.target = None
+        self.columns = []
+        self.output = None
+        self.compare = None
+        self.lines = 0
+
+    def run(self):
+        """
+        Returns
+        -------
+        int
+            Number of output lines compared
+        """
+        try:
+            self.execute(parseScript(self.filename.read_text()))
+            if self.compare is not None:
+                extra = self.compare.readline().rstrip('\r\n')
+                if extra:
+                    raise ComparisonError("Comparison failure at line {}: output ended before\n{}".format(
+                        self.lines + 1, extra))
+        finally:
+            for f in (self.output, self.compare):
+                if f is not None:
+                    f.close()
+        return self.lines
+
+    def execute(self, commands):
+        for command in commands:
+            if isinstance(command, tuple):
+                self.block(*command)
+            else:
+                self.command(command)
+
+    def block(self, kind, argument, body):
+        if kind == 'repeat':
+            if argument is None:
+                raise UnsupportedError("Endless repeat, interactive scripts are not supported")
+            # Plain clock loops run without interpreting the script each cycle
+            if body in [[['ticktock']], [['tick'], ['tock']]]:
+                self.loaded.run(argument)
+                return
+            for _ in range(argument):
+                self.execute(body)
+        else:
+            for _ in range(WHILE_LIMIT):
+                if not self.condition(argument):
+                    return
+                self.execute(body)
+            raise UnsupportedError("while {} did not end, interactive scripts are not supported".format(' '.join(argument)))
+
+    def condition(self, words):
+        if len(words) != 3:
+            raise TestError("Invalid condition {}".format(' '.join(words)))
+        left, op, right = self.loaded.get(words[0]), words[1], parseValue(words[2])
+        if words[0] == 'time':
+            # Chips report time as e.g. 3+ between a tick and its tock
+            left = int(str(left).rstrip('+'))
+        operators = {
+            '=': left == right, '<>': left != right,
+            '<': left < right, '>': left > right,
+            '<=': left <= right, '>=': left >= right,
+        }
+        if op not in operators:
+            raise TestError("Invalid condition {}".format(' '.join(words)))
+        return operators[op]
+
+    def command(self, words):
+        name, arguments = words[0], words[1:]
+        if name == 'load':
+            self.load(arguments)
+        elif name == 'output-file':
+            self.output = open(self.directory / arguments[0], 'w')
+        elif name == 'compare-to':
+            self.compare = open(self.directory / arguments[0], 'r')
+        elif name == 'output-list':
+            self.columns = [OutputColumn(spec) for spec in arguments]
+            self.emit('|' + '|'.join(column.header for column in self.columns) + '|')
+        elif name == 'output':
+            target = self.loaded
+            cells = [column.cell(target.get(column.name)) for column in self.columns]
+            self.emit('|' + '|'.join(cells) + '|')
+        elif name == 'set':
+            self.loaded.set(arguments[0], parseValue(arguments[1]))
+        elif name in ['echo', 'clear-echo', 'breakpoint', 'clear-breakpoints']:
+            pass
+        elif len(arguments) == 2 and arguments[0] == 'load':
+            self.loaded.command([name, 'load', str(self.directory / arguments[1])])
+        elif not self.loaded.command(words):
+            raise TestError("Unsupported command {}".format(' '.join(words)))
+
+    @property
+    def loaded(self):
+        """
+        The target of the script, raising TestError if nothing was loaded yet
+        """
+        if self.target is None:
+            raise TestError("No chip or program loaded")
+        return self.target
+
+    def load(self, arguments):
+        if not arguments:
+            raise UnsupportedError("Loading a directory of VM files is not supported")
+        filename = self.directory / arguments[0]
+        if filename.suffix == '.hdl':
+            self.target = HardwareTarget(filename, self.forceGate, self.cacheDir, self.engine)
+        elif filename.suffix in ['.hack', '.asm', '.bin']:
+            self.target = CPUTarget(filename)
+        else:
+            raise UnsupportedError("Cannot load {}, only .hdl and Hack programs are supported".format(filename.name))
+
+    def emit(self, line):
+        if self.output is not None:
+            self.output.write(line + '\n')
+        if self.compare is None:
+            return
+        self.lines += 1
+        expected = self.compare.readline().rstrip('\r\n')
+        if len(expected) != len(line) or any(e != '*' and e != a for e, a in zip(expected, line)):
+            raise ComparisonError("Comparison failure at line {}:\nexpected {}\n     got {}".format(
+                self.lines, expected, line))
+
+
+def runTest(filename, forceGate=False, cacheDir=None, engine='levelized'):
+    """
+    Run a test script
+
+    Returns
+    -------
+    tuple
+        Status, one of PASS, FAIL or SKIP for unsupported scripts, a message
+        and the seconds taken
+    """
+    start = time.perf_counter()
+    try:
+        lines = TestScript(filename, forceGate, cacheDir, engine).run()
+        status, message = 'PASS', "{} lines compared".format(lines)
+    except UnsupportedError as e:
+        status, message = 'SKIP', str(e)
+    except (TestError, HDLError, OSError) as e:
+        status, message = 'FAIL', str(e)
+    except Exception as e:
+        # A bug in the script or the runner fails this test, not the whole run
+        status, message = 'FAIL', "{}: {}".format(type(e).__name__, e)
+    return status, message, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('filename', nargs='+', help="The .tst scripts to run")
+    argParser.add_argument('--force-gate', action='store_true', help="Simulate memory chips at gate level, never substituting their models")
+    argParser.add_argument('--chip-cache', default=str(CACHE_DIR), metavar='DIR', help="Directory of flattened chips, empty to disable")
+    argParser.add_argument('--engine', choices=sorted(ENGINES), default='levelized', help="Simulation engine for chips")
+    args = argParser.parse_args()
+
+    failures = 0
+    for filename in args.filename:
+        status, message, seconds = runTest(filename, args.force_gate, args.chip_cache or None, args.engine)
+        failures += status == 'FAIL'
+        print("{} {} ({:.2f}s): {}".format(status, filename, seconds, message))
+    sys.exit(1 if failures else 0)
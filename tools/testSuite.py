@@ -0,0 +1,205 @@
+"""
+Runs the .tst scripts of every project in parallel, with cached passes and a JUnit report
+"""
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from xml.etree import ElementTree
+
+from hdlParser import ROOT, ChipLibrary, HDLError
+from builtinChips import BUILTIN_HDL
+from testRunner import TestError, parseScript, runTest
+from chipCache import CACHE_DIR
+
+# Durations and cached passes of previous runs
+STATE_FILE = ROOT / '.testSuite.json'
+
+# Changes to the simulators or the assembler invalidate every cached pass
+TOOL_SOURCES = sorted((ROOT / 'tools').glob('*.py')) + sorted((ROOT / '06').glob('*.py'))
+
+
+def findScripts(paths):
+    """
+    Expand files and directories into a sorted list of .tst scripts
+    """
+    scripts = set()
+    for path in map(Path, paths):
+        if path.is_dir():
+            scripts.update(path.rglob('*.tst'))
+        else:
+            scripts.add(path)
+    return sorted(script.resolve() for script in scripts)
+
+
+def loadedFiles(commands):
+    """
+    Names of the files loaded or compared against by script commands
+    """
+    for command in commands:
+        if isinstance(command, tuple):
+            yield from loadedFiles(command[2])
+        elif command[0] in ['load', 'compare-to'] and len(command) > 1:
+            yield command[1]
+        elif len(command) == 3 and command[1] == 'load':
+            yield command[2]
+
+
+def scriptInputs(script):
+    """
+    Files a script's result depends on: the script itself, the files it
+    loads and compares against, and the .hdl files of loaded chips
+
+    Returns
+    -------
+    list
+        Sorted paths
+    """
+    inputs = {script}
+    try:
+        commands = parseScript(script.read_text())
+    except TestError:
+        return [script]
+
+    for name in loadedFiles(commands):
+        filename = script.parent / name
+        inputs.add(filename)
+        if filename.suffix == '.hdl':
+            try:
+                inputs.update(ChipLibrary.forFile(filename, BUILTIN_HDL).dependencies(filename.stem))
+            except HDLError:
+                pass
+    return sorted(inputs)
+
+
+def inputHash(script, forceGate=False):
+    digest = hashlib.sha256(repr(forceGate).encode())
+    for filename in TOOL_SOURCES + scriptInputs(script):
+        digest.update(str(filename).encode())
+        try:
+            digest.update(filename.read_bytes())
+        except OSError:
+            digest.update(b'missing')
+    return digest.hexdigest()
+
+
+class TestSuite(object):
+    """
+    Schedules scripts on a process pool, longest first by their durations in
+    previous runs, and skips scripts that passed with identical inputs.
+    """
+    def __init__(self, stateFile=STATE_FILE, useCache=True, forceGate=False, chipCache=None):
+        self.stateFile = Path(stateFile)
+        self.useCache = useCache
+        self.forceGate = forceGate
+        self.chipCache = chipCache
+        try:
+            self.state = json.loads(self.stateFile.read_text())
+        except (OSError, ValueError):
+            self.state = {'durations': {}, 'passed': {}}
+
+    def key(self, script):
+        try:
+            return str(script.relative_to(ROOT))
+        except ValueError:
+            return str(script)
+
+    def run(self, scripts, jobs=None):
+        """
+        Returns
+        -------
+        list
+            Tuples of (script, status, message, seconds, cached)
+        """
+        durations = self.state['durations']
+        passed = self.state['passed']
+        results = []
+        pending = {}
+
+        for script in scripts:
+            digest = inputHash(script, self.forceGate)
+            if self.useCache and passed.get(self.key(script)) == digest:
+                results.append((script, 'PASS', 'cached', durations.get(self.key(script), 0.0), True))
+            else:
+                pending[script] = digest
+
+        # Unknown durations first, they may be the longest
+        order = sorted(pending, key=lambda script: -durations.get(self.key(script), float('inf')))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(runTest, str(script), self.forceGate, self.chipCache): script for script in order}
+            for future in as_completed(futures):
+                script = futures[future]
+                try:
+                    status, message, seconds = future.result()
+                except Exception as err:
+                    status, message, seconds = 'FAIL', repr(err), 0.0
+                durations[self.key(script)] = seconds
+                if status == 'PASS':
+                    passed[self.key(script)] = pending[script]
+                else:
+                    passed.pop(self.key(script), None)
+                results.append((script, status, message, seconds, False))
+                print("{} {} ({:.2f}s){}".format(status, self.key(script), seconds,
+                                                 '' if status == 'PASS' else ': ' + message.splitlines()[0]))
+
+        self.save()
+        return sorted(results)
+
+    def save(self):
+        temp = self.stateFile.with_name(self.stateFile.name + '.tmp')
+        temp.write_text(json.dumps(self.state, indent=1, sort_keys=True))
+        temp.replace(self.stateFile)
+
+    def writeJUnit(self, results, filename, elapsed):
+        """
+        Write results as a JUnit XML report, one testcase per script
+        """
+        suite = ElementTree.Element('testsuite', {
+            'name': 'nand2tetris',
+            'tests': str(len(results)),
+            'failures': str(sum(status == 'FAIL' for _, status, _, _, _ in results)),
+            'skipped': str(sum(status == 'SKIP' for _, status, _, _, _ in results)),
+            'time': '{:.3f}'.format(elapsed),
+        })
+        for script, status, message, seconds, cached in results:
+            key = Path(self.key(script))
+            case = ElementTree.SubElement(suite, 'testcase', {
+                'classname': '.'.join(key.parent.parts),
+                'name': key.stem,
+                'time': '{:.3f}'.format(0.0 if cached else seconds),
+            })
+            if status == 'FAIL':
+                ElementTree.SubElement(case, 'failure', {'message': message.splitlines()[0]}).text = message
+            elif status == 'SKIP':
+                ElementTree.SubElement(case, 'skipped', {'message': message})
+            elif cached:
+                ElementTree.SubElement(case, 'system-out').text = 'Passed with the same inputs, not run'
+        ElementTree.ElementTree(suite).write(filename, encoding='utf-8', xml_declaration=True)
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('paths', nargs='*', default=[str(ROOT)], help="The .tst scripts or directories to search for them")
+    argParser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes")
+    argParser.add_argument('--junit', default=None, metavar='FILE', help="Write a JUnit XML report")
+    argParser.add_argument('--no-cache', action='store_true', help="Run scripts even if they passed with the same inputs")
+    argParser.add_argument('--state', default=str(STATE_FILE), help="File keeping durations and cached passes")
+    argParser.add_argument('--force-gate', action='store_true', help="Simulate memory chips at gate level, never substituting their models")
+    argParser.add_argument('--chip-cache', default=str(CACHE_DIR), metavar='DIR', help="Directory of flattened chips, empty to disable")
+    args = argParser.parse_args()
+
+    start = time.perf_counter()
+    suite = TestSuite(args.state, not args.no_cache, args.force_gate, args.chip_cache or None)
+    results = suite.run(findScripts(args.paths), args.jobs)
+    elapsed = time.perf_counter() - start
+
+    counts = {status: sum(result[1] == status for result in results) for status in ['PASS', 'FAIL', 'SKIP']}
+    print("{} passed ({} cached), {} failed, {} skipped in {:.2f}s".format(
+        counts['PASS'], sum(result[4] for result in results), counts['FAIL'], counts['SKIP'], elapsed))
+    if args.junit:
+        suite.writeJUnit(results, args.junit, elapsed)
+    sys.exit(1 if counts['FAIL'] else 0)